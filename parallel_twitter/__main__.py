@@ -0,0 +1,76 @@
+""" Run the ingestion daemon or submit jobs to its queue.
+
+    python -m parallel_twitter run --keys keys.json --queue jobs.db \\
+        --output results.jsonl
+    python -m parallel_twitter submit --queue jobs.db timeline \\
+        '{"user_id": 783214, "since_time": 1600000000}'
+    python -m parallel_twitter status --queue jobs.db
+"""
+
+import argparse
+import json
+import logging
+import signal
+from typing import List, Optional
+
+from parallel_twitter.daemon import Daemon, HANDLERS, JobQueue, JsonLinesSink
+from parallel_twitter.key_registry import load_apis
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m parallel_twitter')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='Run jobs from the queue')
+    run.add_argument('--keys', required=True,
+                     help='JSON file of API keys, see key_registry.load_apis')
+    run.add_argument('--queue', required=True, help='SQLite job database')
+    run.add_argument('--output', required=True,
+                     help='JSON lines file to append results to')
+    run.add_argument('--workers', type=int, default=4,
+                     help='Number of concurrent jobs')
+    run.add_argument('--watch-keys', type=float, default=60.0,
+                     help='Seconds between checks for changed keys')
+    run.add_argument('--exit-when-empty', action='store_true',
+                     help='Stop once every job has run')
+
+    submit = commands.add_parser('submit', help='Add a job to the queue')
+    submit.add_argument('--queue', required=True, help='SQLite job database')
+    submit.add_argument('kind', choices=sorted(HANDLERS))
+    submit.add_argument('params', help='JSON object of job parameters')
+
+    status = commands.add_parser('status', help='Count jobs by state')
+    status.add_argument('--queue', required=True, help='SQLite job database')
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == 'submit':
+            print(queue.put(args.kind, json.loads(args.params)))
+        elif args.command == 'status':
+            print(json.dumps(queue.counts()))
+        else:
+            client = ParallelTwitterClient(apis=load_apis(args.keys))
+            LOGGER.info('Pulled {} valid keys'.format(len(client.key_state)))
+            stop_watching = client.watch_keys(args.keys, args.watch_keys)
+            sink = JsonLinesSink(args.output)
+            daemon = Daemon(client, queue, [sink], workers=args.workers)
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: daemon.stop())
+            try:
+                daemon.run(exit_when_empty=args.exit_when_empty)
+            finally:
+                stop_watching.set()
+                sink.close()
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    log_format = '[%(asctime)s %(threadName)s, %(levelname)s] %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_format, datefmt='%s')
+    main()
@@ -0,0 +1,188 @@
+""" Refresh known posts with the cheapest mix of `StatusesLookup` and
+`GetUserTimeline` requests. """
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import threading
+from typing import Dict, Iterable, List, Set
+
+import twitter
+
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.twitter_operator import GetUserTimeline, StatusesLookup
+
+LOGGER = logging.getLogger(__name__)
+
+# Posts returned per `GetUserTimeline` and `StatusesLookup` request
+TIMELINE_PAGE_SIZE = 200
+LOOKUP_BATCH_SIZE = 100
+# The API only serves a user's 3,200 most recent posts
+MAX_TIMELINE_PAGES = 16
+
+
+class BackfillPlan:
+    """ Which users to refresh by paging their timelines, and which posts to
+    refresh with `StatusesLookup` batches. """
+
+    def __init__(self,
+                 timelines: Dict[int, List[int]],
+                 lookups: List[int],
+                 timeline_pages: Dict[int, int]):
+        """
+        Parameters
+        ----------
+        timelines : Dict[int, List[int]]
+            The known post IDs of each user whose timeline to page
+        lookups : List[int]
+            The post IDs to hydrate with `StatusesLookup`
+        timeline_pages : Dict[int, int]
+            The estimated number of timeline pages for each user in
+            `timelines`
+        """
+        self.timelines = timelines
+        self.lookups = lookups
+        self.timeline_pages = timeline_pages
+
+    @property
+    def timeline_requests(self) -> int:
+        """ The estimated number of `GetUserTimeline` requests. """
+        return sum(self.timeline_pages.values())
+
+    @property
+    def lookup_requests(self) -> int:
+        """ The number of `StatusesLookup` requests. """
+        return math.ceil(len(self.lookups) / LOOKUP_BATCH_SIZE)
+
+    def __repr__(self):
+        return ('BackfillPlan[timelines={0} ({1} requests), lookups={2} '
+                '({3} requests)]').format(len(self.timelines),
+                                          self.timeline_requests,
+                                          len(self.lookups),
+                                          self.lookup_requests)
+
+
+def plan_backfill(posts: Dict[int, Iterable[int]],
+                  post_ids: Iterable[int] = (),
+                  density: float = 1.0) -> BackfillPlan:
+    """
+    Split known posts between timeline pages and lookup batches so that the
+    two endpoints, which have separate rate limits, finish as early as
+    possible when run concurrently.
+
+    Paging a timeline refreshes up to 200 posts per request, but also
+    returns the user's posts that are not known, while a lookup refreshes
+    exactly 100 known posts. Users whose known posts are dense on their
+    timeline are paged first, as long as that shortens the time until both
+    endpoints are done.
+
+    Parameters
+    ----------
+    posts : Dict[int, Iterable[int]]
+        The known post IDs of each user
+    post_ids : Iterable[int]
+        Known post IDs whose author is not known, which are always looked
+        up. Defaults to none.
+    density : float
+        The expected fraction of the posts on a user's timeline, from their
+        oldest known post onwards, that are known. IDs from a previous
+        timeline pull are close to 1, while the posts a user liked are far
+        sparser. Defaults to 1.0.
+    """
+    if not 0 < density <= 1:
+        raise ValueError('density must be in (0, 1]')
+    known = {u: sorted(set(ids), reverse=True) for u, ids in posts.items()}
+    known = {u: ids for u, ids in known.items() if len(ids) > 0}
+    pages = {u: math.ceil(len(ids) / (TIMELINE_PAGE_SIZE * density))
+             for u, ids in known.items()}
+    lookup_rate = StatusesLookup.reqs_per_minute
+    timeline_rate = GetUserTimeline.reqs_per_minute
+
+    def makespan(n_lookups: int, n_pages: int) -> float:
+        return max(math.ceil(n_lookups / LOOKUP_BATCH_SIZE) / lookup_rate,
+                   n_pages / timeline_rate)
+
+    n_lookups = sum(len(ids) for ids in known.values())
+    n_lookups += len(set(post_ids))
+    n_pages = 0
+    timelines: Dict[int, List[int]] = {}
+    # Most posts refreshed per timeline request first
+    for u in sorted(known, key=lambda u: -len(known[u]) / pages[u]):
+        if pages[u] > MAX_TIMELINE_PAGES:
+            continue
+        moved = n_lookups - len(known[u]), n_pages + pages[u]
+        if makespan(*moved) < makespan(n_lookups, n_pages):
+            n_lookups, n_pages = moved
+            timelines[u] = known[u]
+    lookups = sorted(set(post_ids).union(
+        *(ids for u, ids in known.items() if u not in timelines)))
+    plan = BackfillPlan(timelines, lookups,
+                        {u: pages[u] for u in timelines})
+    LOGGER.info(plan)
+    return plan
+
+
+def run_backfill(client: ParallelTwitterClient,
+                 plan: BackfillPlan,
+                 workers: int = 4) -> Dict[int, twitter.Status]:
+    """
+    Run the timeline pulls and lookup batches of a plan concurrently and
+    return the refreshed posts by ID. Known posts that a timeline did not
+    return, e.g. because the density was overestimated, are looked up
+    afterwards; posts that no longer exist are left out.
+
+    Parameters
+    ----------
+    client : ParallelTwitterClient
+        The client to make requests with
+    plan : BackfillPlan
+        A plan from `plan_backfill`
+    workers : int
+        The number of concurrent requests. Defaults to 4.
+    """
+    refreshed: Dict[int, twitter.Status] = {}
+    lock = threading.Lock()
+
+    def pull_timeline(user_id: int) -> List[int]:
+        ids = plan.timelines[user_id]
+        wanted: Set[int] = set(ids)
+        found = [p for p in client.get_user_timeline(
+            user_id=user_id,
+            trim_user=True,
+            include_rts=True,
+            exclude_replies=False,
+            min_count=MAX_TIMELINE_PAGES * TIMELINE_PAGE_SIZE,
+            max_requests=MAX_TIMELINE_PAGES,
+            since_id=ids[-1] - 1) if p.id in wanted]
+        with lock:
+            refreshed.update((p.id, p) for p in found)
+        return sorted(wanted - {p.id for p in found})
+
+    def lookup(post_ids: List[int]) -> None:
+        found = client.statuses_lookup(post_ids)
+        with lock:
+            refreshed.update((p.id, p) for p in found)
+
+    def batches(post_ids: List[int]) -> List[List[int]]:
+        return [post_ids[i:i + LOOKUP_BATCH_SIZE]
+                for i in range(0, len(post_ids), LOOKUP_BATCH_SIZE)]
+
+    # Separate pools so that each endpoint is used while the other waits
+    # for its rate limit
+    with ThreadPoolExecutor(workers) as timeline_pool, \
+            ThreadPoolExecutor(workers) as lookup_pool:
+        timeline_futures = [timeline_pool.submit(pull_timeline, u)
+                            for u in plan.timelines]
+        lookup_futures = [lookup_pool.submit(lookup, b)
+                          for b in batches(plan.lookups)]
+        missing: List[int] = []
+        for f in timeline_futures:
+            missing.extend(f.result())
+        if len(missing) > 0:
+            LOGGER.info('Looking up {} posts missing from timelines'
+                        .format(len(missing)))
+            lookup_futures.extend(lookup_pool.submit(lookup, b)
+                                  for b in batches(missing))
+        for f in lookup_futures:
+            f.result()
+    return refreshed
@@ -0,0 +1,177 @@
+""" Coalesce concurrent single-ID lookups into batched API calls. """
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LookupCoalescer:
+    """
+    Collect lookup requests from many threads for a short window (or until
+    a full batch of IDs accumulates), issue one batched call, and fan the
+    results back out to each waiter. IDs that are already pending or in
+    flight are not requested twice. Up to `workers` batches are in flight
+    at once.
+    """
+
+    def __init__(self,
+                 lookup_fn: Callable[[List[int]], List[Any]],
+                 window: float = 0.05,
+                 batch_size: int = 100,
+                 workers: int = 1):
+        """
+        Parameters
+        ----------
+        lookup_fn : Callable[[List[int]], List[Any]]
+            A function that hydrates at most `batch_size` IDs, returning
+            objects with an `id` attribute. IDs that are missing from the
+            result resolve to None.
+        window : float
+            The number of seconds to wait for more IDs after the first
+            pending ID arrives. Defaults to 0.05.
+        batch_size : int
+            The maximum number of IDs per call. Defaults to 100.
+        workers : int
+            The maximum number of calls in flight, such as the number of
+            API keys. Defaults to 1.
+        """
+        self.lookup_fn = lookup_fn
+        self.window = window
+        self.batch_size = batch_size
+        self.workers = workers
+        self.n_calls = 0
+        self._futures: Dict[int, Future] = {}
+        self._pending: List[int] = []
+        self._first_pending = 0.0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(
+            max(workers, 1), thread_name_prefix='LookupCoalescer')
+        self._closed = False
+
+    def submit(self, object_id: int) -> Future:
+        """
+        Return a `Future` that resolves to the hydrated object for the ID,
+        or None if the API did not return it.
+
+        Parameters
+        ----------
+        object_id : int
+            The ID to hydrate
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('LookupCoalescer is closed')
+            future = self._futures.get(object_id)
+            if future is not None:
+                return future
+            future = Future()
+            self._futures[object_id] = future
+            if len(self._pending) == 0:
+                self._first_pending = time.monotonic()
+            self._pending.append(object_id)
+            self._ensure_thread()
+            self._cond.notify()
+            return future
+
+    def get(self, object_id: int, timeout: Optional[float] = None) -> Any:
+        """
+        Return the hydrated object for the ID, blocking until the batch it
+        was coalesced into completes.
+
+        Parameters
+        ----------
+        object_id : int
+            The ID to hydrate
+        timeout : Optional[float]
+            The maximum number of seconds to wait. Defaults to no limit.
+        """
+        return self.submit(object_id).result(timeout=timeout)
+
+    def lookup(self,
+               object_ids: List[int],
+               timeout: Optional[float] = None) -> List[Any]:
+        """
+        Return the hydrated objects for the IDs, skipping IDs that the API
+        did not return.
+
+        Parameters
+        ----------
+        object_ids : List[int]
+            The IDs to hydrate
+        timeout : Optional[float]
+            The maximum number of seconds to wait for each ID. Defaults to
+            no limit.
+        """
+        futures = [self.submit(i) for i in object_ids]
+        results = [f.result(timeout=timeout) for f in futures]
+        return [r for r in results if r is not None]
+
+    def close(self) -> None:
+        """ Flush the pending IDs, wait for the calls in flight and stop the
+        background threads. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _ensure_thread(self) -> None:
+        """ Start the flushing thread. The caller must hold the lock. """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run,
+                                            name='LookupCoalescer',
+                                            daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> Optional[List[int]]:
+        """ Block until a batch is ready. Return None once closed and
+        drained. """
+        with self._cond:
+            while True:
+                if len(self._pending) == 0:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                remaining = self._first_pending + self.window \
+                    - time.monotonic()
+                if len(self._pending) >= self.batch_size \
+                        or remaining <= 0 or self._closed:
+                    batch = self._pending[:self.batch_size]
+                    self._pending = self._pending[self.batch_size:]
+                    self._first_pending = time.monotonic()
+                    return batch
+                self._cond.wait(remaining)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List[int]) -> None:
+        """ Hydrate a batch and resolve the waiting futures. """
+        with self._cond:
+            self.n_calls += 1
+        try:
+            results = self.lookup_fn(batch)
+        except Exception as ex:  # pylint: disable=broad-except
+            LOGGER.info('Coalesced lookup of {0} IDs failed: {1}'
+                        .format(len(batch), ex))
+            with self._cond:
+                futures = [self._futures.pop(i) for i in batch]
+            for f in futures:
+                f.set_exception(ex)
+            return
+        by_id = {r.id: r for r in results}
+        with self._cond:
+            futures = [(self._futures.pop(i), i) for i in batch]
+        for f, i in futures:
+            f.set_result(by_id.get(i))
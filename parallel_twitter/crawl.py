@@ -0,0 +1,154 @@
+""" Graph crawls that spend scarce friend-list requests on promising users
+first. """
+
+from collections import defaultdict
+import heapq
+import itertools
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CrawlPriority:
+    """
+    Scores users in the crawl frontier. Users with higher scores are
+    expanded first.
+    """
+
+    # Whether scores change as in-group follower counts change
+    dynamic = False
+
+    def score(self,
+              users: List[int],
+              n_followers: Dict[int, int]) -> List[float]:
+        """
+        Return a score for each user.
+
+        Parameters
+        ----------
+        users : List[int]
+            The Twitter IDs of users that were just added to the frontier,
+            or whose in-group follower count changed if `dynamic` is True
+        n_followers : Dict[int, int]
+            The number of followers each user has within the group so far
+        """
+        raise NotImplementedError
+
+
+class InGroupFollowers(CrawlPriority):
+    """ Expand the users followed by the most users in the group so far. """
+
+    dynamic = True
+
+    def score(self,
+              users: List[int],
+              n_followers: Dict[int, int]) -> List[float]:
+        return [n_followers[u] for u in users]
+
+
+class HydratedFollowers(CrawlPriority):
+    """ Expand the users with the most followers overall, hydrating new
+    users with batched `UsersLookup` requests. """
+
+    def __init__(self, client: ParallelTwitterClient):
+        """
+        Parameters
+        ----------
+        client : ParallelTwitterClient
+            The client to hydrate users with
+        """
+        self.client = client
+
+    def score(self,
+              users: List[int],
+              n_followers: Dict[int, int]) -> List[float]:
+        counts = {u.id: u.followers_count
+                  for u in self.client.users_lookup(users)}
+        return [counts.get(u) or 0 for u in users]
+
+
+def prioritized_crawl(client: ParallelTwitterClient,
+                      seed: Iterable[int],
+                      depth: int,
+                      priority: CrawlPriority,
+                      max_count: Optional[int] = 200,
+                      max_requests: Optional[int] = None) -> Dict[int, int]:
+    """
+    Crawl users' friends, always expanding the frontier user with the
+    highest priority. Return the number of followers each user has within
+    the group of visited users.
+
+    Seed users are expanded first. As in
+    `examples.calculate_industry_group`, users more than `depth` hops from
+    a seed user are counted but not expanded. If the request budget runs
+    out, the counts are an approximate ranking of the group.
+
+    Parameters
+    ----------
+    client : ParallelTwitterClient
+        The client to make requests with
+    seed : Iterable[int]
+        Twitter user IDs to start the crawl from
+    depth : int
+        The maximum number of hops from a seed user to expand
+    priority : CrawlPriority
+        Decides which frontier user to expand next
+    max_count : Optional[int]
+        The maximum number of friends to pull for a given user. Defaults
+        to 200.
+    max_requests : Optional[int]
+        The maximum number of `GetFriendIDs` requests. Defaults to no limit.
+    """
+    n_followers: Dict[int, int] = defaultdict(int)
+    depths: Dict[int, int] = {}
+    expanded: Set[int] = set()
+    scores: Dict[int, float] = {}
+    counter = itertools.count()
+    # Entries are (-score, insertion order, user); an entry is stale if the
+    # user's score changed or the user was expanded since it was pushed
+    frontier: List[Tuple[float, int, int]] = []
+
+    def push(users: List[int]) -> None:
+        if len(users) == 0:
+            return
+        for u, s in zip(users, priority.score(users, n_followers)):
+            scores[u] = s
+            heapq.heappush(frontier, (-s, next(counter), u))
+
+    for u in seed:
+        depths.setdefault(u, 0)
+        heapq.heappush(frontier, (-float('inf'), next(counter), u))
+        scores[u] = float('inf')
+
+    n_requests = 0
+    while len(frontier) > 0:
+        neg_score, _, u = heapq.heappop(frontier)
+        if u in expanded or scores[u] != -neg_score:
+            continue
+        if max_requests is not None and n_requests >= max_requests:
+            LOGGER.info('Exhausted the budget of {} requests with {} users '
+                        'in the frontier'.format(max_requests, len(frontier)))
+            break
+        expanded.add(u)
+        new_users: List[int] = []
+        changed: List[int] = []
+        for page in client.iter_friend_ids(user_id=u, max_count=max_count):
+            n_requests += 1
+            for f in page:
+                n_followers[f] += 1
+                if f not in depths:
+                    depths[f] = depths[u] + 1
+                    if depths[f] <= depth:
+                        new_users.append(f)
+                elif priority.dynamic and f not in expanded \
+                        and 0 < depths[f] <= depth:
+                    # Seed users keep their infinite score
+                    changed.append(f)
+            if max_requests is not None and n_requests >= max_requests:
+                break
+        push(new_users)
+        push(changed)
+    return n_followers
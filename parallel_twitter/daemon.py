@@ -0,0 +1,453 @@
+""" A long-running worker that executes jobs from a durable queue with a
+single warm client. """
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from parallel_twitter.crawl import (
+    HydratedFollowers,
+    InGroupFollowers,
+    prioritized_crawl
+)
+from parallel_twitter.examples import hydrated_post_row, post_row, user_row
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+LOGGER = logging.getLogger(__name__)
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """ A unit of work claimed from a `JobQueue`. """
+
+    def __init__(self,
+                 job_id: int,
+                 kind: str,
+                 params: Dict[str, Any],
+                 attempts: int):
+        """
+        Parameters
+        ----------
+        job_id : int
+            The ID of the job in the queue
+        kind : str
+            The kind of job, a key of `HANDLERS`
+        params : Dict[str, Any]
+            The parameters of the job
+        attempts : int
+            The number of times the job was claimed, including this time
+        """
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params
+        self.attempts = attempts
+
+    def __repr__(self):
+        return 'Job[{0} {1}, attempt {2}]'.format(self.job_id, self.kind,
+                                                   self.attempts)
+
+
+class JobQueue:
+    """
+    A durable job queue in a SQLite database. Several processes can share
+    the database; claiming a job is atomic.
+
+    A claimed job is leased to the claiming worker for `lease_time` seconds,
+    and the worker extends its leases with `heartbeat` while the jobs run.
+    Once a lease expires, e.g. because the worker crashed, the job can be
+    claimed by any worker, so running jobs of other live workers are never
+    taken over.
+    """
+
+    def __init__(self,
+                 path: str,
+                 lease_time: float = 300.0,
+                 worker: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        path : str
+            The path of the database. It is created if necessary.
+        lease_time : float
+            The number of seconds a claimed job stays leased without a
+            heartbeat. Defaults to 300.
+        worker : Optional[str]
+            A name for this worker, unique among the workers sharing the
+            database. Defaults to the host name, process ID and a random
+            suffix.
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.worker = worker or '{0}:{1}:{2}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._conn = sqlite3.connect(path,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'kind TEXT NOT NULL, '
+                'params TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'error TEXT, '
+                'worker TEXT, '
+                'lease_until REAL, '
+                'created REAL NOT NULL, '
+                'updated REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status '
+                               'ON jobs (status, id)')
+
+    def put(self, kind: str, params: Dict[str, Any]) -> int:
+        """
+        Add a job and return its ID.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of job, a key of `HANDLERS`
+        params : Dict[str, Any]
+            JSON-serializable parameters of the job
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO jobs (kind, params, status, created, updated) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (kind, json.dumps(params), PENDING, now, now))
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Job]:
+        """ Lease the oldest pending job, or running job whose lease
+        expired, to this worker and return it. Return None if there are no
+        such jobs. """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    'SELECT id, kind, params, attempts FROM jobs '
+                    'WHERE status = ? OR (status = ? AND lease_until < ?) '
+                    'ORDER BY id LIMIT 1',
+                    (PENDING, RUNNING, now)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        'UPDATE jobs SET status = ?, attempts = ?, '
+                        'worker = ?, lease_until = ?, updated = ? '
+                        'WHERE id = ?',
+                        (RUNNING, row[3] + 1, self.worker,
+                         now + self.lease_time, now, row[0]))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3] + 1)
+
+    def complete(self, job: Job) -> None:
+        """ Mark a job as done. """
+        self._set_status(job, DONE, None)
+
+    def fail(self, job: Job, error: str, retry: bool) -> None:
+        """
+        Record a job's error and either return it to the queue or mark it
+        as failed.
+
+        Parameters
+        ----------
+        job : Job
+            The job that failed
+        error : str
+            A description of the error
+        retry : bool
+            Whether to run the job again
+        """
+        self._set_status(job, PENDING if retry else FAILED, error)
+
+    def heartbeat(self) -> int:
+        """ Extend the leases of the jobs this worker is running. Return the
+        number of jobs. """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET lease_until = ? '
+                'WHERE status = ? AND worker = ?',
+                (now + self.lease_time, RUNNING, self.worker))
+            return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        """ Return the running jobs whose lease expired, e.g. because their
+        worker crashed, to the queue. Return the number of jobs. """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL, '
+                'lease_until = NULL, updated = ? '
+                'WHERE status = ? AND lease_until < ?',
+                (PENDING, now, RUNNING, now))
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """ Return the number of jobs in each state. """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        """ Close the database connection. """
+        with self._lock:
+            self._conn.close()
+
+    def _set_status(self, job: Job, status: str, error: Optional[str]) -> None:
+        """ Record the outcome of a job, unless its lease expired and
+        another worker claimed it. """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, lease_until = NULL, '
+                'updated = ? WHERE id = ? AND status = ? AND worker = ?',
+                (status, error, time.time(), job.job_id, RUNNING,
+                 self.worker))
+        if cursor.rowcount == 0:
+            LOGGER.warning('Lease of {} was lost, ignoring its outcome'
+                           .format(job))
+
+
+class Sink:
+    """ Receives the rows produced by each job. """
+
+    def write(self, job: Job, rows: List[Dict[str, Any]]) -> None:
+        """
+        Store the rows of a completed job. Called from worker threads.
+
+        Parameters
+        ----------
+        job : Job
+            The completed job
+        rows : List[Dict[str, Any]]
+            The rows the job produced
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """ Flush and release any resources. """
+
+
+class JsonLinesSink(Sink):
+    """ Append every row to a JSON lines file, tagged with its job. """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path : str
+            The path of the file to append to
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, job: Job, rows: List[Dict[str, Any]]) -> None:
+        lines = [json.dumps(dict(row, job_id=job.job_id, kind=job.kind),
+                            default=str) + '\n' for row in rows]
+        with self._lock:
+            self._file.writelines(lines)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def run_lookup(client: ParallelTwitterClient,
+               params: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """ Hydrate `user_ids` and/or `post_ids`. """
+    rows = [user_row(u)
+            for u in client.users_lookup(params.get('user_ids', []))]
+    rows.extend(hydrated_post_row(p)
+                for p in client.statuses_lookup(params.get('post_ids', [])))
+    return rows
+
+
+def run_timeline(client: ParallelTwitterClient,
+                 params: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """ Pull the posts of `user_id`, optionally since `since_time`, up to
+    `min_count` posts. """
+    return [post_row(p) for p in client.get_user_timeline(
+        user_id=params['user_id'],
+        trim_user=True,
+        include_rts=params.get('include_rts', False),
+        exclude_replies=params.get('exclude_replies', True),
+        min_count=params.get('min_count', 200),
+        since_time=params.get('since_time'))]
+
+
+def run_followers(client: ParallelTwitterClient,
+                  params: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """ Pull up to `max_count` follower IDs of `user_id`, hydrating them if
+    `hydrate` is set. """
+    user_id = params['user_id']
+    rows: List[Dict[str, Any]] = []
+    for page in client.iter_follower_ids(user_id=user_id,
+                                         max_count=params.get('max_count')):
+        if params.get('hydrate', False):
+            rows.extend(dict(user_row(u), followed=user_id)
+                        for u in client.users_lookup(page))
+        else:
+            rows.extend({'id': i, 'followed': user_id} for i in page)
+    return rows
+
+
+def run_crawl(client: ParallelTwitterClient,
+              params: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """ Crawl the friends of `seed` users, see `crawl.prioritized_crawl`. """
+    priority = HydratedFollowers(client) \
+        if params.get('priority') == 'followers' else InGroupFollowers()
+    n_followers = prioritized_crawl(client=client,
+                                    seed=params['seed'],
+                                    depth=params.get('depth', 1),
+                                    priority=priority,
+                                    max_count=params.get('max_count', 200),
+                                    max_requests=params.get('max_requests'))
+    return [{'id': u, 'n_followers': n} for u, n in n_followers.items()]
+
+
+Handler = Callable[[ParallelTwitterClient, Dict[str, Any]],
+                   Iterable[Dict[str, Any]]]
+
+# The functions that execute each kind of job
+HANDLERS: Dict[str, Handler] = {
+    'lookup': run_lookup,
+    'timeline': run_timeline,
+    'followers': run_followers,
+    'crawl': run_crawl
+}
+
+
+class Daemon:
+    """
+    Execute jobs from a `JobQueue` concurrently with one shared client, so
+    that keys are probed once and every job is scheduled against the same
+    rate limit state.
+    """
+
+    def __init__(self,
+                 client: ParallelTwitterClient,
+                 queue: JobQueue,
+                 sinks: List[Sink],
+                 workers: int = 4,
+                 poll_interval: float = 1.0,
+                 max_attempts: int = 3):
+        """
+        Parameters
+        ----------
+        client : ParallelTwitterClient
+            The client to make requests with
+        queue : JobQueue
+            The queue to take jobs from
+        sinks : List[Sink]
+            Where to write the rows of completed jobs
+        workers : int
+            The number of jobs to run concurrently. Defaults to 4.
+        poll_interval : float
+            The number of seconds to wait when the queue is empty. Defaults
+            to 1. It should be well below the queue's `lease_time`, since
+            leases are extended between polls.
+        max_attempts : int
+            The number of times to try a job before marking it as failed.
+            Defaults to 3.
+        """
+        self.client = client
+        self.queue = queue
+        self.sinks = sinks
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stop_event = threading.Event()
+
+    def run(self, exit_when_empty: bool = False) -> None:
+        """
+        Run jobs until `stop` is called, letting running jobs finish.
+
+        Parameters
+        ----------
+        exit_when_empty : bool
+            Whether to return once the queue is empty and no job is running.
+            Defaults to False.
+        """
+        n_requeued = self.queue.requeue_expired()
+        if n_requeued > 0:
+            LOGGER.info('Requeued {} interrupted jobs'.format(n_requeued))
+        slots = threading.Semaphore(self.workers)
+        next_heartbeat = 0.0
+        with ThreadPoolExecutor(self.workers,
+                                thread_name_prefix='Daemon') as pool:
+            while not self.stop_event.is_set():
+                if time.monotonic() >= next_heartbeat:
+                    self.queue.heartbeat()
+                    next_heartbeat = time.monotonic() \
+                        + self.queue.lease_time / 3
+                if not slots.acquire(timeout=self.poll_interval):
+                    continue
+                job = self.queue.claim()
+                if job is None:
+                    slots.release()
+                    if exit_when_empty and self._idle(slots) \
+                            and self.queue.counts().get(PENDING, 0) == 0:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                future = pool.submit(self.run_job, job)
+                future.add_done_callback(lambda _: slots.release())
+        LOGGER.info('Stopped with jobs {}'.format(self.queue.counts()))
+
+    def stop(self) -> None:
+        """ Stop claiming jobs. """
+        self.stop_event.set()
+
+    def run_job(self, job: Job) -> None:
+        """ Run a job, write its rows to every sink and record the outcome
+        in the queue. """
+        LOGGER.info('Running {}'.format(job))
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            self.queue.fail(job, 'Unknown job kind', retry=False)
+            return
+        try:
+            rows = list(handler(self.client, job.params))
+            for sink in self.sinks:
+                sink.write(job, rows)
+        except Exception as ex:  # pylint: disable=broad-except
+            retry = job.attempts < self.max_attempts
+            LOGGER.info('{0} failed{1}: {2}'.format(
+                job, ', retrying' if retry else '', ex))
+            self.queue.fail(job, '{0}: {1}'.format(type(ex).__name__, ex),
+                            retry=retry)
+            return
+        self.queue.complete(job)
+        LOGGER.info('Completed {0} with {1} rows'.format(job, len(rows)))
+
+    def _idle(self, slots: threading.Semaphore) -> bool:
+        """ Whether no job is running, i.e. every slot is free. """
+        acquired = 0
+        while acquired < self.workers and slots.acquire(blocking=False):
+            acquired += 1
+        for _ in range(acquired):
+            slots.release()
+        return acquired == self.workers
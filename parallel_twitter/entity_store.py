@@ -0,0 +1,153 @@
+""" Share the users and posts seen in any response within a client. """
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import twitter
+
+
+class _LruCache:
+    """ A bounded mapping from IDs to objects and the times they were
+    stored, evicting the least recently stored objects first. """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: 'OrderedDict[int, Tuple[Any, float]]' = OrderedDict()
+
+    def put(self, object_id: int, obj: Any, now: float) -> None:
+        if self.max_size <= 0:
+            return
+        self._items[object_id] = (obj, now)
+        self._items.move_to_end(object_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get(self, object_id: int, oldest: float) -> Optional[Any]:
+        item = self._items.get(object_id)
+        if item is None or item[1] < oldest:
+            return None
+        return item[0]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class EntityStore:
+    """
+    Remember the `twitter.User` and `twitter.Status` objects returned by any
+    endpoint, including the users and retweets embedded in posts, so that
+    later lookups of the same IDs are served without a request.
+
+    Objects are served while they are younger than `max_age`, so counts
+    such as likes and followers are at most that stale. Trimmed users,
+    which only have an ID, and posts with trimmed users are not stored, nor
+    are posts from operators that request fewer fields than a lookup.
+    """
+
+    def __init__(self,
+                 max_age: float = 15 * 60,
+                 max_users: int = 100000,
+                 max_statuses: int = 100000):
+        """
+        Parameters
+        ----------
+        max_age : float
+            The number of seconds an object is served for. Defaults to 15
+            minutes.
+        max_users : int
+            The maximum number of users to keep. Defaults to 100,000.
+        max_statuses : int
+            The maximum number of posts to keep. Defaults to 100,000.
+        """
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._users = _LruCache(max_users)
+        self._statuses = _LruCache(max_statuses)
+        self._lock = threading.Lock()
+
+    def harvest(self, result: Any, statuses: bool = True) -> None:
+        """
+        Store the users and posts in an API result. Other results, such as
+        lists of IDs, are ignored.
+
+        Parameters
+        ----------
+        result : Any
+            The result of a `TwitterOp`
+        statuses : bool
+            Whether to store the posts, rather than only the users embedded
+            in them. Posts requested with fewer fields than `StatusesLookup`,
+            e.g. without entities, should not be stored. Defaults to True.
+        """
+        if not isinstance(result, list) or len(result) == 0 \
+                or not isinstance(result[0], (twitter.User, twitter.Status)):
+            return
+        now = time.monotonic()
+        with self._lock:
+            for obj in result:
+                self._store(obj, now, statuses)
+
+    def users(self, user_ids: Sequence[int]) -> Dict[int, twitter.User]:
+        """
+        Return the fresh users among the IDs.
+
+        Parameters
+        ----------
+        user_ids : Sequence[int]
+            The Twitter IDs of users
+        """
+        return self._fresh(self._users, user_ids)
+
+    def statuses(self, post_ids: Sequence[int]) -> Dict[int, twitter.Status]:
+        """
+        Return the fresh posts among the IDs.
+
+        Parameters
+        ----------
+        post_ids : Sequence[int]
+            The IDs of posts
+        """
+        return self._fresh(self._statuses, post_ids)
+
+    def __len__(self) -> int:
+        return len(self._users) + len(self._statuses)
+
+    def __repr__(self):
+        return 'EntityStore[users={0}, statuses={1}, hits={2}, misses={3}]' \
+            .format(len(self._users), len(self._statuses),
+                    self.hits, self.misses)
+
+    def _fresh(self, cache: _LruCache, ids: Sequence[int]) -> Dict[int, Any]:
+        oldest = time.monotonic() - self.max_age
+        found: Dict[int, Any] = {}
+        with self._lock:
+            for i in ids:
+                obj = cache.get(i, oldest)
+                if obj is not None:
+                    found[i] = obj
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def _store(self, obj: Any, now: float, statuses: bool) -> None:
+        """ Store an object and the objects embedded in it. Posts are only
+        stored with their full user, so that they can be served in place of
+        a `StatusesLookup`. """
+        pending: List[Any] = [obj]
+        while len(pending) > 0:
+            obj = pending.pop()
+            if isinstance(obj, twitter.Status):
+                if obj.user is None or obj.user.screen_name is None:
+                    continue
+                if statuses:
+                    self._statuses.put(obj.id, obj, now)
+                pending.extend(o for o in (obj.user,
+                                           obj.retweeted_status,
+                                           obj.quoted_status)
+                               if o is not None)
+            elif isinstance(obj, twitter.User) \
+                    and obj.screen_name is not None:
+                self._users.put(obj.id, obj, now)
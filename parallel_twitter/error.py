@@ -2,8 +2,20 @@
 
 from typing import Dict, List
 
+import requests
 from twitter import TwitterError
 
+# Error codes for temporary server-side failures
+TRANSIENT_CODES = {130, 131}
+# Error codes for keys that are invalid, expired, suspended or locked
+AUTH_CODES = {32, 64, 89, 215, 326}
+# Messages raised by `python-twitter` when the response is an HTML error page
+TRANSIENT_MESSAGES = {
+    'Capacity Error',
+    'Technical Error',
+    'Exceeded connection limit for user'
+}
+
 
 class OutOfKeysError(Exception):
     """ Error for no valid API keys """
@@ -14,6 +26,15 @@ class OutOfKeysError(Exception):
         return self.args[0]
 
 
+class ReplayError(Exception):
+    """ Error for a request that is not in a recorded archive """
+
+    @property
+    def message(self):
+        """ Returns the first argument used to construct this error. """
+        return self.args[0]
+
+
 def not_authorized_error(ex: TwitterError) -> bool:
     """
     Return whether the `TwitterError` is an authorization error. This would
@@ -27,6 +48,41 @@ def not_authorized_error(ex: TwitterError) -> bool:
     return isinstance(ex.message, str) and ex.message == 'Not authorized.'
 
 
+def no_match_error(ex: TwitterError) -> bool:
+    """
+    Return whether the `TwitterError` means that none of the requested
+    users exist, which `UsersLookup` reports as an error rather than as an
+    empty result.
+
+    Parameters
+    ----------
+    ex : TwitterError
+        An error raised by the Twitter API client
+    """
+    if isinstance(ex.message, List) and isinstance(ex.message[0], Dict):
+        return ex.message[0].get('code') == 17
+    return False
+
+
+def auth_error(ex: TwitterError) -> bool:
+    """
+    Return whether the `TwitterError` means that the API key itself is
+    unusable, for example because it was revoked or the account was
+    suspended. Unlike `not_authorized_error`, this is a problem with the key
+    rather than with the requested data.
+
+    Parameters
+    ----------
+    ex : TwitterError
+        An error raised by the Twitter API client
+    """
+    if isinstance(ex.message, List) and isinstance(ex.message[0], Dict):
+        return ex.message[0].get('code') in AUTH_CODES
+    if isinstance(ex.message, Dict):
+        return ex.message.get('message') == 'Unauthorized'
+    return False
+
+
 def rate_limit_error(ex: TwitterError) -> bool:
     """
     Return whether the `TwitterError` is the result of a rate limit.
@@ -41,4 +97,43 @@ def rate_limit_error(ex: TwitterError) -> bool:
         # Rate limiting codes
         if code == 420 or code == 429 or code == 88:
             return True
+    # Raised by `python-twitter` itself when its cached limit is exhausted
+    return isinstance(ex.message, str) and ex.message == 'Rate limit exceeded'
+
+
+def transient_error(ex: Exception) -> bool:
+    """
+    Return whether the error is likely to succeed if retried, such as a
+    network timeout, a dropped connection or a 5xx response from Twitter.
+
+    Parameters
+    ----------
+    ex : Exception
+        An error raised while calling the Twitter API
+    """
+    if isinstance(ex, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if not isinstance(ex, TwitterError):
+        return False
+    if isinstance(ex.message, List) and isinstance(ex.message[0], Dict):
+        return ex.message[0].get('code') in TRANSIENT_CODES
+    if isinstance(ex.message, Dict):
+        return ex.message.get('message') in TRANSIENT_MESSAGES \
+            or 'Unknown error' in ex.message
     return False
+
+
+def key_error(ex: Exception) -> bool:
+    """
+    Return whether the error should count against the health of the API key
+    that made the request: a transient or network error, or a failure to
+    authenticate. Errors caused by the request itself, such as a user that
+    does not exist, are not the key's fault.
+
+    Parameters
+    ----------
+    ex : Exception
+        An error raised while calling the Twitter API
+    """
+    return transient_error(ex) or isinstance(ex, TwitterError) \
+        and auth_error(ex)
@@ -2,30 +2,44 @@
 
 from collections import defaultdict, deque
 import logging
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
 
 import twitter
 
-from parallel_twitter.parallel_client import ParallelTwitterClient
-from parallel_twitter.twitter_operator import (
-    GetFriendIDs,
-    GetUserTimeline,
-    StatusesLookup,
-    UsersLookup
+from parallel_twitter.backfill import plan_backfill, run_backfill
+from parallel_twitter.crawl import (
+    CrawlPriority,
+    HydratedFollowers,
+    InGroupFollowers,
+    prioritized_crawl
 )
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.pipeline import HydrationPipeline
+from parallel_twitter.profiling import PROFILER
+from parallel_twitter.workers import WorkerPool
 
 LOGGER = logging.getLogger(__name__)
 
+# The names of the crawl priorities accepted by `calculate_industry_group`
+PRIORITIES = ('in_group', 'followers')
+
 
-def calculate_industry_group(seed: List[int],
+def calculate_industry_group(seed: Iterable[int],
                              depth: int,
                              apis: List[twitter.Api],
-                             max_count: int=200) -> Dict[int, int]:
+                             max_count: int=200,
+                             priority: Optional[Union[str, CrawlPriority]]=None,
+                             max_requests: Optional[int]=None
+                             ) -> Dict[int, int]:
     """
     Run a breadth-first search on a set of users' friends on Twitter.
     Return the number of followers each user has within the group of nth-degree
     connections.
 
+    If a `priority` is specified, the most promising users are expanded first
+    instead, which gets more of the useful graph out of a limited number of
+    `GetFriendIDs` requests.
+
     A depth of `k` means that we will not visit the friends of anyone who is
     more than `k` hops away from a seed user. Users who are exactly `k + 1`
     hops away will still be included in the output dictionary (since we know
@@ -34,8 +48,9 @@ def calculate_industry_group(seed: List[int],
 
     Parameters
     ----------
-    seed : List[int]
-        List of Twitter user IDs to initialize the BFS
+    seed : Iterable[int]
+        Twitter user IDs to initialize the BFS, such as an `IdSet` loaded
+        with `id_set.read_ids('data/politics.ids')`
     depth : int
         The depth of the BFS. Defaults to 2.
     apis : List[twitter.Api]
@@ -43,25 +58,53 @@ def calculate_industry_group(seed: List[int],
         `parallel_client.oauth_dicts_to_apis`
     max_count : int
         The maximum number of friends to pull for a given user
+    priority : Optional[Union[str, CrawlPriority]]
+        Either 'in_group' to expand the users with the most followers in the
+        group so far, 'followers' to expand the users with the most followers
+        overall, or a `crawl.CrawlPriority`. Defaults to breadth-first order.
+    max_requests : Optional[int]
+        Stop after this many `GetFriendIDs` requests, returning approximate
+        counts. Defaults to no limit.
     """
+    if isinstance(priority, str) and priority not in PRIORITIES:
+        raise ValueError('priority must be one of {} or a CrawlPriority'
+                         .format(PRIORITIES))
     n_followers: Dict[int, int] = defaultdict(int)
     client = ParallelTwitterClient(apis=apis)
     LOGGER.info(
-        'Pulled {} valid keys'.format(len(client.operators[GetFriendIDs]))
+        'Pulled {} valid keys'.format(len(client.key_state))
     )
+    if priority is not None:
+        if priority == 'in_group':
+            priority = InGroupFollowers()
+        elif priority == 'followers':
+            priority = HydratedFollowers(client)
+        return prioritized_crawl(client=client,
+                                 seed=seed,
+                                 depth=depth,
+                                 priority=priority,
+                                 max_count=max_count,
+                                 max_requests=max_requests)
+    n_requests = 0
     users_queue: deque = deque()
     for u in seed:
         users_queue.append((u, 0))
     depth_flags: Set[int] = set()
     while len(users_queue) > 0:
+        if max_requests is not None and n_requests >= max_requests:
+            LOGGER.info('Exhausted the budget of {} requests'
+                        .format(max_requests))
+            break
         u, n = users_queue.popleft()
         if n not in depth_flags:
             depth_flags.add(n)
             LOGGER.info('Reached depth: {}'.format(n))
             LOGGER.info('Size of queue: {}'.format(len(users_queue)))
 
-        user_friends = client.get_friend_ids(user_id=u,
-                                             max_count=max_count)
+        user_friends: Set[int] = set()
+        for page in client.iter_friend_ids(user_id=u, max_count=max_count):
+            n_requests += 1
+            user_friends.update(page)
         for f in user_friends:
             if n < depth and f not in n_followers:
                 users_queue.append((f, n + 1))
@@ -70,13 +113,15 @@ def calculate_industry_group(seed: List[int],
 
 
 def pull_users_posts(users: List[int],
-                     apis: List[twitter.Api]) -> List[Dict[str, Any]]:
+                     apis: List[twitter.Api],
+                     workers: int = 0,
+                     worker_kind: str = 'thread',
+                     since_time: Optional[float] = None
+                     ) -> List[Dict[str, Any]]:
     """
     Return a list of the specified users' posts and the number of likes they
     received.
 
-    TODO(@neel): Add a `since_unix_time` parameter.
-
     Parameters
     ----------
     users : List[int]
@@ -84,28 +129,75 @@ def pull_users_posts(users: List[int],
     apis : List[twitter.Api]
         A list of twitter.Api objects, which can be obtained from
         `parallel_client.oauth_dicts_to_apis`
+    workers : int
+        The number of workers to build rows on while the next timeline is
+        pulled. Defaults to 0, which builds them inline.
+    worker_kind : str
+        Either 'thread' or 'process'. Defaults to 'thread'.
+    since_time : Optional[float]
+        Only pull posts created at or after this Unix time, up to the 3,200
+        most recent posts the API serves. Defaults to the latest 2,000 posts.
     """
     posts: List[Dict[str, Any]] = []
     client = ParallelTwitterClient(apis=apis)
     LOGGER.info(
-        'Pulled {} valid keys'.format(len(client.operators[GetUserTimeline]))
+        'Pulled {} valid keys'.format(len(client.key_state))
     )
-    for u in users:
-        user_posts = client.get_user_timeline(user_id=u,
-                                              trim_user=True,
-                                              include_rts=False,
-                                              exclude_replies=True,
-                                              min_count=2000)
-        posts.extend([{
-            # Fields are set on the `Status` object by reflection
-            'id': p.id,
-            'user_id': p.user.id,
-            'timestamp': p.created_at_in_seconds,
-            'n_likes': p.favorite_count
-        } for p in user_posts])
+    min_count = 2000 if since_time is None else 3200
+    with WorkerPool(post_row, workers, worker_kind, phase='rows') as pool:
+        for u in users:
+            pool.submit(client.get_user_timeline(user_id=u,
+                                                 trim_user=True,
+                                                 include_rts=False,
+                                                 exclude_replies=True,
+                                                 min_count=min_count,
+                                                 since_time=since_time))
+            posts.extend(pool.drain())
+        posts.extend(pool.close())
     return posts
 
 
+def post_row(p: twitter.Status) -> Dict[str, Any]:
+    """ Return the number of likes of a post. """
+    return {
+        # Fields are set on the `Status` object by reflection
+        'id': p.id,
+        'user_id': p.user.id,
+        'timestamp': p.created_at_in_seconds,
+        'n_likes': p.favorite_count
+    }
+
+
+def refresh_posts(posts: Dict[int, Iterable[int]],
+                  apis: List[twitter.Api],
+                  post_ids: Iterable[int] = (),
+                  density: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Return the current number of likes of known posts, paging the timelines
+    of users with many known posts and looking up the rest.
+
+    Parameters
+    ----------
+    posts : Dict[int, Iterable[int]]
+        The known post IDs of each user, e.g. from a previous run of
+        `pull_users_posts`
+    apis : List[twitter.Api]
+        A list of twitter.Api objects, which can be obtained from
+        `parallel_client.oauth_dicts_to_apis`
+    post_ids : Iterable[int]
+        Known post IDs whose author is not known
+    density : float
+        The expected fraction of each user's timeline that is known. See
+        `backfill.plan_backfill`.
+    """
+    client = ParallelTwitterClient(apis=apis)
+    LOGGER.info('Pulled {} valid keys'.format(len(client.key_state)))
+    refreshed = run_backfill(client,
+                             plan_backfill(posts, post_ids, density))
+    with PROFILER.timer('rows'):
+        return [post_row(p) for p in refreshed.values()]
+
+
 def pull_hydrated_users(users: List[int],
                         apis: List[twitter.Api]) -> List[Dict[str, Any]]:
     """
@@ -121,19 +213,56 @@ def pull_hydrated_users(users: List[int],
     """
     client = ParallelTwitterClient(apis=apis)
     LOGGER.info(
-        'Pulled {} valid keys'.format(len(client.operators[UsersLookup]))
+        'Pulled {} valid keys'.format(len(client.key_state))
     )
-    return [
-        {
-            # Fields are set on the `User` object by reflection
-            'id': u.id,
-            'handle': u.screen_name,
-            'location': u.location,
-            'verified': u.verified,
-            'followers': u.followers_count,
-            'friends': u.friends_count
-        } for u in client.users_lookup(users)
-    ]
+    hydrated = client.users_lookup(users)
+    with PROFILER.timer('rows'):
+        return [user_row(u) for u in hydrated]
+
+
+def pull_hydrated_connections(seed: Iterable[int],
+                              apis: List[twitter.Api],
+                              relation: str = 'followers',
+                              max_count: Optional[int] = None
+                              ) -> List[Dict[str, Any]]:
+    """
+    Return a list of dictionaries containing features for each follower (or
+    friend) of the seed users, without duplicates. Pulling IDs and hydrating
+    them run concurrently in a `HydrationPipeline`.
+
+    Parameters
+    ----------
+    seed : Iterable[int]
+        Twitter user IDs whose followers or friends to hydrate
+    apis : List[twitter.Api]
+        A list of twitter.Api objects, which can be obtained from
+        `parallel_client.oauth_dicts_to_apis`
+    relation : str
+        Either 'followers' or 'friends'. Defaults to 'followers'.
+    max_count : Optional[int]
+        The maximum number of IDs to pull for each seed user
+    """
+    client = ParallelTwitterClient(apis=apis)
+    LOGGER.info('Pulled {} valid keys'.format(len(client.key_state)))
+    rows: List[Dict[str, Any]] = []
+    HydrationPipeline(client,
+                      relation=relation,
+                      max_ids_per_seed=max_count).run(
+                          seed, lambda u: rows.append(user_row(u)))
+    return rows
+
+
+def user_row(u: twitter.User) -> Dict[str, Any]:
+    """ Return the features of a hydrated user. """
+    return {
+        # Fields are set on the `User` object by reflection
+        'id': u.id,
+        'handle': u.screen_name,
+        'location': u.location,
+        'verified': u.verified,
+        'followers': u.followers_count,
+        'friends': u.friends_count
+    }
 
 
 def pull_hydrated_posts(posts: List[int],
@@ -152,30 +281,36 @@ def pull_hydrated_posts(posts: List[int],
     """
     client = ParallelTwitterClient(apis=apis)
     LOGGER.info(
-        'Pulled {} valid keys'.format(len(client.operators[StatusesLookup]))
+        'Pulled {} valid keys'.format(len(client.key_state))
     )
-    return [
-        {
-            # Fields are set on the `Status` object by reflection
-            'id': p.id,
-            'user_id': p.user.id,
-            'text': p.text,
-            'full_text': p.full_text,
-            'n_likes': p.favorite_count,
-            'n_retweets': p.retweet_count,
-            'location': p.location,
-            'geo': p.geo,
-            'url': 'https://www.twitter.com/{0}/status/{1}'.format(
-                p.user.screen_name, p.id
-            ),
-            'timestamp': p.created_at_in_seconds
-
-        } for p in client.statuses_lookup(posts)
-    ]
+    hydrated = client.statuses_lookup(posts)
+    with PROFILER.timer('rows'):
+        return [hydrated_post_row(p) for p in hydrated]
+
+
+def hydrated_post_row(p: twitter.Status) -> Dict[str, Any]:
+    """ Return the features of a hydrated post. """
+    return {
+        # Fields are set on the `Status` object by reflection
+        'id': p.id,
+        'user_id': p.user.id,
+        'text': p.text,
+        'full_text': p.full_text,
+        'n_likes': p.favorite_count,
+        'n_retweets': p.retweet_count,
+        'location': p.location,
+        'geo': p.geo,
+        'url': 'https://www.twitter.com/{0}/status/{1}'.format(
+            p.user.screen_name, p.id
+        ),
+        'timestamp': p.created_at_in_seconds
+    }
 
 
 def pull_users_likes(users: List[int],
-                     apis: List[twitter.Api]) -> List[Dict[str, Any]]:
+                     apis: List[twitter.Api],
+                     workers: int = 0,
+                     worker_kind: str = 'thread') -> List[Dict[str, Any]]:
     """
     Return the last 200 posts that each of the specified users liked.
 
@@ -186,27 +321,33 @@ def pull_users_likes(users: List[int],
     apis : List[twitter.Api]
         A list of twitter.Api objects, which can be obtained from
         `parallel_client.oauth_dicts_to_apis`
+    workers : int
+        The number of workers to build rows on while the next user's likes
+        are pulled. Defaults to 0, which builds them inline.
+    worker_kind : str
+        Either 'thread' or 'process'. Defaults to 'thread'.
     """
     client = ParallelTwitterClient(apis=apis)
     LOGGER.info(
-        'Pulled {} valid keys'.format(len(client.operators[UsersLookup]))
+        'Pulled {} valid keys'.format(len(client.key_state))
     )
-    posts = []
-    for idx, u in enumerate(users):
-        posts.extend([
-            {
-                # Fields are set on the `Status` object by reflection
-                'id': p.id,
-                'user_id': p.user.id,
-                'timestamp': p.created_at_in_seconds,
-                'n_likes': p.favorite_count,
-                'favorited_by': u
-            }
-            for p in client.get_favorites(user_id=u, max_count=200)
-        ])
+    posts: List[Dict[str, Any]] = []
+    with WorkerPool(liked_post_row, workers, worker_kind,
+                    phase='rows') as pool:
+        for u in users:
+            pool.submit(client.get_favorites(user_id=u, max_count=200), u)
+            posts.extend(pool.drain())
+        posts.extend(pool.close())
     return posts
 
 
+def liked_post_row(p: twitter.Status, favorited_by: int) -> Dict[str, Any]:
+    """ Return the number of likes of a post that a user liked. """
+    row = post_row(p)
+    row['favorited_by'] = favorited_by
+    return row
+
+
 if __name__ == '__main__':
     log_format = '[%(asctime)s %(threadName)s, %(levelname)s] %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_format, datefmt='%s')
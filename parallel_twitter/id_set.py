@@ -0,0 +1,208 @@
+""" Compact, memory-mappable sets of Twitter IDs. """
+
+from array import array
+import bisect
+import mmap
+import pickle
+import struct
+import sys
+from typing import Iterable, Iterator, List, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# File header: magic bytes followed by the number of IDs
+MAGIC = b'PTIDS\x00\x00\x01'
+HEADER = struct.Struct('<8sQ')
+
+
+class IdSet:
+    """
+    An immutable set of Twitter IDs stored as a sorted array of unique
+    64-bit integers.
+
+    On disk, an `IdSet` is a 16-byte header followed by the raw
+    little-endian array, so `load` can memory-map the file instead of
+    unpickling millions of boxed integers. Set operations are vectorized
+    with `numpy` when it is installed.
+    """
+
+    def __init__(self, ids: Union[array, memoryview, 'np.ndarray']):
+        """
+        Use `from_iterable` or `load` rather than calling this directly.
+
+        Parameters
+        ----------
+        ids : Union[array, memoryview, np.ndarray]
+            A sorted sequence of unique 64-bit integers
+        """
+        self._ids = ids
+        self._mmap = None
+
+    @classmethod
+    def from_iterable(cls, ids: Iterable[int]) -> 'IdSet':
+        """
+        Return an `IdSet` containing the IDs.
+
+        Parameters
+        ----------
+        ids : Iterable[int]
+            Twitter IDs, in any order and possibly with duplicates
+        """
+        if isinstance(ids, IdSet):
+            return ids
+        if np is not None:
+            return cls(np.unique(np.fromiter(ids, dtype=np.int64)))
+        return cls(array('q', sorted(set(ids))))
+
+    @classmethod
+    def load(cls, path: str) -> 'IdSet':
+        """
+        Memory-map an `IdSet` written by `save`. The file must not be
+        modified while the set is in use.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+        """
+        with open(path, 'rb') as f:
+            magic, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not an ID set file'.format(path))
+            if count == 0:
+                return cls(array('q'))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if np is not None:
+            ids = np.frombuffer(mapped, dtype='<i8', count=count,
+                                offset=HEADER.size)
+        elif sys.byteorder == 'little':
+            ids = memoryview(mapped)[HEADER.size:].cast('q')
+        else:
+            ids = array('q', mapped[HEADER.size:])
+            ids.byteswap()
+        id_set = cls(ids)
+        id_set._mmap = mapped
+        return id_set
+
+    def save(self, path: str) -> None:
+        """
+        Write the set to a file that can be memory-mapped with `load`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+        """
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self)))
+            if np is not None:
+                f.write(np.asarray(self._ids, dtype='<i8').tobytes())
+            elif sys.byteorder == 'little':
+                f.write(bytes(self._ids))
+            else:
+                swapped = array('q', self._ids)
+                swapped.byteswap()
+                f.write(swapped.tobytes())
+
+    def union(self, other: Iterable[int]) -> 'IdSet':
+        """ Return the IDs in either set. """
+        other = IdSet.from_iterable(other)
+        if np is not None:
+            return IdSet(np.union1d(self._ids, other._ids))
+        return IdSet(array('q', sorted(set(self._ids).union(other._ids))))
+
+    def difference(self, other: Iterable[int]) -> 'IdSet':
+        """ Return the IDs in this set that are not in the other set, such
+        as the IDs that have not been crawled yet. """
+        other = IdSet.from_iterable(other)
+        if np is not None:
+            return IdSet(np.setdiff1d(self._ids, other._ids,
+                                      assume_unique=True))
+        excluded = set(other._ids)
+        return IdSet(array('q', (i for i in self._ids if i not in excluded)))
+
+    def intersection(self, other: Iterable[int]) -> 'IdSet':
+        """ Return the IDs in both sets. """
+        other = IdSet.from_iterable(other)
+        if np is not None:
+            return IdSet(np.intersect1d(self._ids, other._ids,
+                                        assume_unique=True))
+        included = set(other._ids)
+        return IdSet(array('q', (i for i in self._ids if i in included)))
+
+    def to_list(self) -> List[int]:
+        """ Return the IDs as a list of Python integers. """
+        return [int(i) for i in self._ids]
+
+    def __or__(self, other: Iterable[int]) -> 'IdSet':
+        return self.union(other)
+
+    def __sub__(self, other: Iterable[int]) -> 'IdSet':
+        return self.difference(other)
+
+    def __and__(self, other: Iterable[int]) -> 'IdSet':
+        return self.intersection(other)
+
+    def __contains__(self, object_id: int) -> bool:
+        if np is not None:
+            idx = int(np.searchsorted(self._ids, object_id))
+        else:
+            idx = bisect.bisect_left(self._ids, object_id)
+        return idx < len(self._ids) and self._ids[idx] == object_id
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[int, List[int]]:
+        if isinstance(idx, slice):
+            return [int(i) for i in self._ids[idx]]
+        return int(self._ids[idx])
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        return len(self) == len(other) \
+            and all(a == b for a, b in zip(self._ids, other._ids))
+
+    def __repr__(self):
+        return 'IdSet[size={}]'.format(len(self))
+
+
+def read_ids(path: str) -> IdSet:
+    """
+    Return the IDs in a file written by `write_ids`, or in a legacy pickled
+    list of IDs if the path ends in `.pickle`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    """
+    if path.endswith('.pickle'):
+        with open(path, 'rb') as f:
+            return IdSet.from_iterable(pickle.load(f))
+    return IdSet.load(path)
+
+
+def write_ids(path: str, ids: Iterable[int]) -> IdSet:
+    """
+    Write IDs to a file that can be memory-mapped with `read_ids`. Return
+    the IDs as an `IdSet`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    ids : Iterable[int]
+        Twitter IDs, such as the result of `get_followers` or the keys of
+        `calculate_industry_group`
+    """
+    id_set = IdSet.from_iterable(ids)
+    id_set.save(path)
+    return id_set
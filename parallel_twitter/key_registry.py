@@ -0,0 +1,242 @@
+""" Track the health of the API keys used by `ParallelTwitterClient`. """
+
+import json
+import logging
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Union
+
+import twitter
+
+LOGGER = logging.getLogger(__name__)
+
+KeySource = Union[str, Callable[[], List[twitter.Api]]]
+
+
+class KeyHealth:
+    """ Request statistics for a single API key. """
+
+    def __init__(self, key_id: int, api: twitter.Api):
+        self.key_id = key_id
+        self.api = api
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_auth_failures = 0
+        self.latency = 0.0
+        self.quarantined_until = 0.0
+        self.reason: Optional[str] = None
+
+    @property
+    def error_rate(self) -> float:
+        """ The fraction of requests with this key that failed. """
+        if self.n_requests == 0:
+            return 0.0
+        return self.n_errors / self.n_requests
+
+    @property
+    def quarantined(self) -> bool:
+        """ Whether requests should currently avoid this key. """
+        return self.quarantined_until > time.time()
+
+    def __repr__(self):
+        return ('KeyHealth[ID={0}, requests={1}, error_rate={2:.2f}, '
+                'latency={3:.3f}, quarantined={4}]').format(
+                    self.key_id, self.n_requests, self.error_rate,
+                    self.latency, self.quarantined)
+
+
+class KeyRegistry:
+    """
+    A registry of API keys and their health. Keys with authentication
+    failures or a high error rate are quarantined, so that revoked or
+    suspended keys stop being tried on every call.
+    """
+
+    def __init__(self,
+                 max_error_rate: float = 0.5,
+                 min_requests: int = 20,
+                 quarantine_time: float = 900.0,
+                 auth_quarantine_time: float = 86400.0,
+                 latency_decay: float = 0.1):
+        """
+        Parameters
+        ----------
+        max_error_rate : float
+            Quarantine a key once this fraction of its requests have failed.
+            Defaults to 0.5.
+        min_requests : int
+            The number of requests before the error rate is considered.
+            Defaults to 20.
+        quarantine_time : float
+            Seconds to quarantine a key with a high error rate. Defaults to
+            900, which is one rate limit window.
+        auth_quarantine_time : float
+            Seconds to quarantine a key that failed to authenticate.
+            Defaults to 86400.
+        latency_decay : float
+            The weight of the newest sample in the exponentially weighted
+            average latency. Defaults to 0.1.
+        """
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.quarantine_time = quarantine_time
+        self.auth_quarantine_time = auth_quarantine_time
+        self.latency_decay = latency_decay
+        self.keys: Dict[int, KeyHealth] = {}
+        self._next_id = 0
+
+    def add(self, api: twitter.Api) -> KeyHealth:
+        """
+        Register an API key and return its health record.
+
+        Parameters
+        ----------
+        api : twitter.Api
+            The API key to register
+        """
+        health = KeyHealth(self._next_id, api)
+        self.keys[health.key_id] = health
+        self._next_id += 1
+        return health
+
+    def remove(self, key_id: int) -> None:
+        """
+        Forget an API key.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID assigned to the key by `add`
+        """
+        self.keys.pop(key_id, None)
+
+    def find(self, api: twitter.Api) -> Optional[int]:
+        """
+        Return the ID of a registered key with the same credentials, or
+        None if there is no such key.
+
+        Parameters
+        ----------
+        api : twitter.Api
+            The API key to look for
+        """
+        identity = api_identity(api)
+        for key_id, health in self.keys.items():
+            if api_identity(health.api) == identity:
+                return key_id
+        return None
+
+    def available(self, key_id: int) -> bool:
+        """ Return whether the key is registered and not quarantined. """
+        health = self.keys.get(key_id)
+        return health is not None and not health.quarantined
+
+    def record_success(self, key_id: int, latency: float) -> None:
+        """
+        Record a successful request.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID of the key that made the request
+        latency : float
+            The duration of the request in seconds
+        """
+        health = self.keys.get(key_id)
+        if health is None:
+            return
+        health.n_requests += 1
+        health.latency += self.latency_decay * (latency - health.latency)
+
+    def record_failure(self, key_id: int, auth_failure: bool = False) -> None:
+        """
+        Record a failed request, quarantining the key if it is unhealthy.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID of the key that made the request
+        auth_failure : bool
+            Whether the key failed to authenticate. Defaults to False.
+        """
+        health = self.keys.get(key_id)
+        if health is None:
+            return
+        health.n_requests += 1
+        health.n_errors += 1
+        if auth_failure:
+            health.n_auth_failures += 1
+            self.quarantine(key_id,
+                            self.auth_quarantine_time,
+                            'authentication failure')
+        elif health.n_requests >= self.min_requests \
+                and health.error_rate > self.max_error_rate:
+            self.quarantine(key_id,
+                            self.quarantine_time,
+                            'error rate {:.2f}'.format(health.error_rate))
+
+    def quarantine(self, key_id: int, seconds: float, reason: str) -> None:
+        """
+        Stop using a key for the specified number of seconds.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID of the key to quarantine
+        seconds : float
+            How long to avoid the key
+        reason : str
+            A description of why the key was quarantined
+        """
+        health = self.keys[key_id]
+        LOGGER.warning('Quarantining key {0} for {1}s: {2}'
+                       .format(key_id, seconds, reason))
+        health.quarantined_until = time.time() + seconds
+        health.reason = reason
+        # Start afresh once the quarantine ends
+        health.n_requests = 0
+        health.n_errors = 0
+
+    def unhealthy(self) -> List[KeyHealth]:
+        """ Return the health records of the quarantined keys. """
+        return [h for h in self.keys.values() if h.quarantined]
+
+
+def api_identity(api: twitter.Api) -> Hashable:
+    """
+    Return a value that identifies the credentials of an API key, so that
+    keys can be matched across reloads.
+
+    Parameters
+    ----------
+    api : twitter.Api
+        A Twitter API object
+    """
+    token = getattr(api, '_access_token_key', None)
+    return token if token is not None else id(api)
+
+
+def load_apis(source: KeySource) -> List[twitter.Api]:
+    """
+    Return the API keys from a JSON file or a callback.
+
+    The file should contain an object with `consumer_key`, `consumer_secret`
+    and `oauth`, a list of dictionaries with `oauth_token` and
+    `oauth_token_secret` as accepted by `oauth_dicts_to_apis`.
+
+    Parameters
+    ----------
+    source : KeySource
+        The path to a JSON file or a function returning `twitter.Api` objects
+    """
+    if callable(source):
+        return source()
+    with open(source) as f:
+        config = json.load(f)
+    return [
+        twitter.Api(
+            consumer_key=config['consumer_key'],
+            consumer_secret=config['consumer_secret'],
+            access_token_key=o['oauth_token'],
+            access_token_secret=o['oauth_token_secret']
+        ) for o in config['oauth']
+    ]
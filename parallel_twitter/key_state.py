@@ -0,0 +1,273 @@
+""" Compact rate limit state for every API key and endpoint. """
+
+from array import array
+import heapq
+import logging
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type
+)
+
+import twitter
+
+from parallel_twitter.profiling import PROFILER
+from parallel_twitter.twitter_operator import TwitterOp
+
+LOGGER = logging.getLogger(__name__)
+
+
+class KeyLease(NamedTuple):
+    """ A key selected by `KeyStateTable.checkout`. The API object is kept,
+    so that the request can finish if the key is removed meanwhile. """
+    row: int
+    key_id: int
+    api: twitter.Api
+
+
+class KeyStateTable:
+    """
+    The rate limit state of every API key, with one row per key and an
+    array-backed column of remaining requests and reset times per endpoint.
+
+    Each endpoint has a selection index: a heap of `(renewal time, row)`
+    entries for the keys that are not currently in use. Removed keys leave
+    stale entries behind, which are discarded lazily when popped, so
+    selecting and returning a key is O(log n). When every eligible key is
+    in use by another thread, `checkout` waits for one to be released.
+    """
+
+    # Seconds between re-checking whether a key became eligible while
+    # waiting, e.g. because its circuit breaker closed
+    WAIT_INTERVAL = 1.0
+
+    def __init__(self, operators: List[TwitterOp]):
+        """
+        Parameters
+        ----------
+        operators : List[TwitterOp]
+            One instance of every operator that requests are made with
+        """
+        self.operators: Dict[Type[TwitterOp], TwitterOp] = {
+            type(op): op for op in operators
+        }
+        self.key_ids: List[Optional[int]] = []
+        self.apis: List[Optional[twitter.Api]] = []
+        self.rows: Dict[int, int] = {}
+        self.remaining: Dict[Type[TwitterOp], array] = {
+            fn: array('l') for fn in self.operators
+        }
+        self.reset: Dict[Type[TwitterOp], array] = {
+            fn: array('d') for fn in self.operators
+        }
+        self._generation = array('l')
+        self._free_rows: List[int] = []
+        self._index: Dict[Type[TwitterOp], List[Tuple[float, int, int]]] = {
+            fn: [] for fn in self.operators
+        }
+        self._in_use: Dict[Type[TwitterOp], Set[int]] = {
+            fn: set() for fn in self.operators
+        }
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, key_id: int, api: twitter.Api) -> int:
+        """
+        Add a key and return its row. Raise a `TwitterError` if the key
+        cannot check its rate limits, in which case it is not added.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID of the key in the `KeyRegistry`
+        api : twitter.Api
+            The API key
+        """
+        limits = {fn: op.check_rate_limit(api)
+                  for fn, op in self.operators.items()}
+        with self._lock:
+            if len(self._free_rows) > 0:
+                row = self._free_rows.pop()
+                self.key_ids[row] = key_id
+                self.apis[row] = api
+            else:
+                row = len(self.key_ids)
+                self.key_ids.append(key_id)
+                self.apis.append(api)
+                self._generation.append(0)
+                for fn in self.operators:
+                    self.remaining[fn].append(0)
+                    self.reset[fn].append(0.0)
+            self.rows[key_id] = row
+            for fn, limit in limits.items():
+                self._set_limit(fn, row, limit.remaining, limit.reset)
+                self._push(fn, row)
+            return row
+
+    def remove(self, key_id: int) -> None:
+        """
+        Remove a key. If the key is in use, it is not returned to the index
+        when released.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID of the key in the `KeyRegistry`
+        """
+        with self._lock:
+            row = self.rows.pop(key_id, None)
+            if row is None:
+                return
+            self.key_ids[row] = None
+            self.apis[row] = None
+            self._generation[row] += 1
+            self._free_rows.append(row)
+            # Threads waiting for this key should stop waiting
+            self._released.notify_all()
+
+    def renewal_time(self, fn: Type[TwitterOp], row: int) -> float:
+        """ Return the time at which the key can make requests to the
+        endpoint again, or 0 if it has requests remaining. """
+        if self.remaining[fn][row] > 0:
+            return 0.0
+        return self.reset[fn][row]
+
+    def checkout(self,
+                 fn: Type[TwitterOp],
+                 skip: Callable[[int], bool],
+                 ready_only: bool = False,
+                 claim: Optional[Callable[[int], bool]] = None
+                 ) -> Optional[KeyLease]:
+        """
+        Remove the key with the earliest renewal time for the endpoint from
+        its index and return it. The caller must return the key with
+        `release`.
+
+        If no key is eligible but an eligible key is in use by another
+        caller, wait until it is released. Return None if no key can serve
+        the endpoint.
+
+        Parameters
+        ----------
+        fn : Type[TwitterOp]
+            The operator class to select a key for
+        skip : Callable[[int], bool]
+            Return True for a key ID that should not be selected. It must
+            not have side effects, since it is also used to decide whether
+            to wait for keys in use.
+        ready_only : bool
+            If True, only select a key that is not rate limited, without
+            waiting for keys in use
+        claim : Optional[Callable[[int], bool]]
+            Called for a key ID before it is selected; return False to skip
+            the key instead. Defaults to selecting every key not skipped.
+        """
+        with self._lock:
+            while True:
+                selected = self._select(fn, skip, ready_only, claim)
+                if selected is not None:
+                    key_id = self.key_ids[selected]
+                    self._in_use[fn].add(key_id)
+                    return KeyLease(selected, key_id, self.apis[selected])
+                if ready_only or not any(
+                        key_id in self.rows and not skip(key_id)
+                        for key_id in self._in_use[fn]):
+                    return None
+                with PROFILER.timer('wait.key'):
+                    self._released.wait(KeyStateTable.WAIT_INTERVAL)
+
+    def release(self, fn: Type[TwitterOp], lease: KeyLease) -> None:
+        """
+        Return a key selected by `checkout` to the endpoint's index, unless
+        the key was removed in the meantime, and wake up callers waiting
+        for a key.
+
+        Parameters
+        ----------
+        fn : Type[TwitterOp]
+            The operator class that the key was selected for
+        lease : KeyLease
+            The key returned by `checkout`
+        """
+        with self._lock:
+            self._in_use[fn].discard(lease.key_id)
+            if self.key_ids[lease.row] == lease.key_id:
+                self._push(fn, lease.row)
+            self._released.notify_all()
+
+    def _select(self,
+                fn: Type[TwitterOp],
+                skip: Callable[[int], bool],
+                ready_only: bool,
+                claim: Optional[Callable[[int], bool]]) -> Optional[int]:
+        """ Pop the eligible key with the earliest renewal time from the
+        endpoint's index. """
+        index = self._index[fn]
+        skipped: List[Tuple[float, int, int]] = []
+        selected: Optional[int] = None
+        while len(index) > 0:
+            entry = heapq.heappop(index)
+            renewal, row, generation = entry
+            if generation != self._generation[row]:
+                # The key was removed
+                continue
+            if ready_only and renewal > time.time():
+                skipped.append(entry)
+                break
+            key_id = self.key_ids[row]
+            if skip(key_id) or claim is not None and not claim(key_id):
+                skipped.append(entry)
+                continue
+            selected = row
+            break
+        for entry in skipped:
+            heapq.heappush(index, entry)
+        return selected
+
+    def refresh(self, fn: Type[TwitterOp], lease: KeyLease) -> None:
+        """
+        Update the remaining requests and reset time for a key from the
+        rate limits cached by `twitter.Api`. This does not make a request
+        once the key's rate limits have been initialized. Nothing is
+        updated if the key was removed since it was checked out.
+
+        Parameters
+        ----------
+        fn : Type[TwitterOp]
+            The operator class to refresh
+        lease : KeyLease
+            The key returned by `checkout`
+        """
+        if self.key_ids[lease.row] != lease.key_id:
+            return
+        limit = self.operators[fn].check_rate_limit(lease.api)
+        with self._lock:
+            if self.key_ids[lease.row] != lease.key_id:
+                return
+            if limit.remaining == 0:
+                LOGGER.info('Setting the renewal time for key {0} to {1}'
+                            .format(lease.key_id, limit.reset))
+            self._set_limit(fn, lease.row, limit.remaining, limit.reset)
+
+    def _set_limit(self,
+                   fn: Type[TwitterOp],
+                   row: int,
+                   remaining: int,
+                   reset: float) -> None:
+        self.remaining[fn][row] = remaining
+        self.reset[fn][row] = reset
+
+    def _push(self, fn: Type[TwitterOp], row: int) -> None:
+        heapq.heappush(self._index[fn], (self.renewal_time(fn, row),
+                                         row,
+                                         self._generation[row]))
@@ -1,17 +1,21 @@
 """ Objects to mock the Twitter API. """
 
-from typing import Any, List
+import threading
+import time
+from typing import Any, Dict, List, Sequence, Tuple
 
 import twitter
 from twitter.ratelimit import EndpointRateLimit
 
+from parallel_twitter.snowflake import snowflake_to_time
+
 
 class MockBlockedApi:
     """ An API key where the rate limit reset time is stale """
     def __init__(self, renewal_time: int):
         self.renewal_time = renewal_time
 
-    def GetFriendIDs(self, **params: Any) -> List[str]:
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
         raise twitter.TwitterError('Rate limit exceeded')
 
     def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
@@ -25,8 +29,8 @@ class MockValidApi:
     def __init__(self, response: List[str]):
         self.response = response
 
-    def GetFriendIDs(self, **params: Any) -> List[str]:
-        return self.response
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        return 0, 0, self.response
 
     def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
         return EndpointRateLimit(limit=15,
@@ -40,10 +44,221 @@ class MockSingleBlockedApi:
         self.renewal_time = renewal_time
         self.response = response
 
-    def GetFriendIDs(self, **params: Any) -> List[str]:
-        return self.response
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        return 0, 0, self.response
 
     def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
         return EndpointRateLimit(limit=15,
                                  remaining=0,
                                  reset=self.renewal_time)
+
+
+class MockLookupApi:
+    """ An API key that hydrates any requested user or post ID """
+    def __init__(self):
+        self.calls: List[List[int]] = []
+
+    def UsersLookup(self, user_id: List[int], **params: Any) -> List[twitter.User]:
+        self.calls.append(list(user_id))
+        return [twitter.User(id=i, screen_name=str(i)) for i in user_id]
+
+    def GetStatuses(self, status_ids: List[int], **params: Any) -> List[twitter.Status]:
+        self.calls.append(list(status_ids))
+        return [twitter.Status(id=i) for i in status_ids]
+
+    def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
+        return EndpointRateLimit(limit=900,
+                                 remaining=900,
+                                 reset=0)
+
+
+class MockMissingLookupApi(MockLookupApi):
+    """ An API key that hydrates any user ID except the `missing` ones """
+    def __init__(self, missing: Sequence[int]):
+        super().__init__()
+        self.missing = set(missing)
+
+    def UsersLookup(self, user_id: List[int], **params: Any) -> List[twitter.User]:
+        users = super().UsersLookup([i for i in user_id
+                                     if i not in self.missing])
+        if len(users) == 0:
+            raise twitter.TwitterError(
+                [{'code': 17, 'message': 'No user matches for specified '
+                                         'terms.'}])
+        return users
+
+
+class MockFavoritesApi(MockLookupApi):
+    """ An API key that serves the posts each user liked, without their
+    entities """
+    def __init__(self, likes: Dict[int, List[int]]):
+        super().__init__()
+        self.likes = likes
+
+    def GetFavorites(self, user_id: int = None, **params: Any) -> List[twitter.Status]:
+        return [twitter.Status(id=p, user=twitter.User(id=p, screen_name=str(p)))
+                for p in self.likes.get(user_id, [])]
+
+
+class MockFlakyApi:
+    """ An API key that fails with a transient error a number of times """
+    def __init__(self, n_failures: int, response: List[str]):
+        self.n_failures = n_failures
+        self.response = response
+        self.n_calls = 0
+
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        self.n_calls += 1
+        if self.n_calls <= self.n_failures:
+            raise twitter.TwitterError(
+                [{'code': 130, 'message': 'Over capacity'}])
+        return 0, 0, self.response
+
+    def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
+        return EndpointRateLimit(limit=15,
+                                 remaining=15,
+                                 reset=0)
+
+
+class MockSlowApi(MockValidApi):
+    """ An API key with no rate limit that responds after a delay """
+    def __init__(self, delay: float, response: List[str]):
+        super().__init__(response)
+        self.delay = delay
+
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        time.sleep(self.delay)
+        return 0, 0, self.response
+
+
+class MockSlowFlakyApi(MockValidApi):
+    """ An API key that fails with a transient error after a delay """
+    def __init__(self, delay: float):
+        super().__init__([])
+        self.delay = delay
+
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        time.sleep(self.delay)
+        raise twitter.TwitterError([{'code': 130, 'message': 'Over capacity'}])
+
+
+class MockMissingUserApi(MockValidApi):
+    """ An API key that fails for users that do not exist """
+    def __init__(self, missing: List[int], response: List[str]):
+        super().__init__(response)
+        self.missing = missing
+        self.n_calls = 0
+
+    def GetFriendIDsPaged(self,
+                          user_id: int = None,
+                          **params: Any) -> Tuple[int, int, List[str]]:
+        self.n_calls += 1
+        if user_id in self.missing:
+            raise twitter.TwitterError(
+                [{'code': 50, 'message': 'User not found.'}])
+        return 0, 0, self.response
+
+
+class MockPagedApi:
+    """ An API key that returns friend and follower IDs in pages """
+    def __init__(self, pages: List[List[int]]):
+        self.pages = pages
+        self.cursors: List[int] = []
+
+    def GetFriendIDsPaged(self,
+                          cursor: int = -1,
+                          count: int = 5000,
+                          **params: Any) -> Tuple[int, int, List[int]]:
+        self.cursors.append(cursor)
+        page = 0 if cursor == -1 else cursor
+        next_cursor = page + 1 if page + 1 < len(self.pages) else 0
+        return next_cursor, page - 1, self.pages[page][:count]
+
+    GetFollowerIDsPaged = GetFriendIDsPaged
+
+    def CheckRateLimit(self, *params: Any) -> EndpointRateLimit:
+        return EndpointRateLimit(limit=15,
+                                 remaining=15,
+                                 reset=0)
+
+
+class MockRevokedApi(MockValidApi):
+    """ An API key whose token was revoked after the client started """
+    def __init__(self):
+        super().__init__([])
+        self.n_calls = 0
+
+    def GetFriendIDsPaged(self, **params: Any) -> Tuple[int, int, List[str]]:
+        self.n_calls += 1
+        raise twitter.TwitterError(
+            [{'code': 89, 'message': 'Invalid or expired token.'}])
+
+
+class MockGraphApi(MockLookupApi):
+    """ An API key that serves follower and friend IDs from a graph, holding
+    each request open for `delay` seconds. The IDs of `private` users are
+    not authorized. """
+    def __init__(self,
+                 graph: Dict[int, List[int]],
+                 page_size: int = 2,
+                 delay: float = 0,
+                 private: Sequence[int] = ()):
+        super().__init__()
+        self.graph = graph
+        self.page_size = page_size
+        self.delay = delay
+        self.private = set(private)
+
+    def UsersLookup(self, user_id: List[int], **params: Any) -> List[twitter.User]:
+        # Not time.sleep, which tests patch
+        threading.Event().wait(self.delay)
+        return super().UsersLookup(user_id, **params)
+
+    def GetFollowerIDsPaged(self,
+                            user_id: int,
+                            cursor: int = -1,
+                            count: int = 5000,
+                            **params: Any) -> Tuple[int, int, List[int]]:
+        threading.Event().wait(self.delay)
+        if user_id in self.private:
+            raise twitter.TwitterError('Not authorized.')
+        ids = self.graph.get(user_id, [])
+        start = 0 if cursor == -1 else cursor
+        end = start + min(count, self.page_size)
+        next_cursor = end if end < len(ids) else 0
+        return next_cursor, start - 1, ids[start:end]
+
+    GetFriendIDsPaged = GetFollowerIDsPaged
+
+
+class MockTimelineApi(MockLookupApi):
+    """ An API key that serves users' timelines, newest post first """
+    def __init__(self, timelines: Dict[int, List[int]], page_size: int = 2):
+        super().__init__()
+        self.timelines = timelines
+        self.page_size = page_size
+        self.owners = {p: u for u, posts in timelines.items() for p in posts}
+        self.timeline_calls: List[int] = []
+
+    def GetUserTimeline(self,
+                        user_id: int,
+                        max_id: int = None,
+                        since_id: int = None,
+                        **params: Any) -> List[twitter.Status]:
+        self.timeline_calls.append(user_id)
+        posts = [p for p in self.timelines.get(user_id, [])
+                 if (max_id is None or p <= max_id)
+                 and (since_id is None or p > since_id)]
+        return [self._status(p) for p in posts[:self.page_size]]
+
+    def GetStatuses(self, status_ids: List[int], **params: Any) -> List[twitter.Status]:
+        self.calls.append(list(status_ids))
+        return [self._status(i) for i in status_ids if i in self.owners]
+
+    def _status(self, post_id: int) -> twitter.Status:
+        created_at = time.strftime('%a %b %d %H:%M:%S +0000 %Y',
+                                   time.gmtime(snowflake_to_time(post_id)))
+        return twitter.Status(id=post_id,
+                              user=twitter.User(id=self.owners[post_id]),
+                              created_at=created_at,
+                              favorite_count=post_id % 7)
@@ -1,23 +1,50 @@
 """ A wrapper for the Twitter API to parallelize requests across multiple
 API keys. """
 
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import logging
+import os
+import threading
 import time
 from typing import (
     Any,
     Callable,
     Dict,
+    Iterator,
     List,
     Optional,
+    Sequence,
     Set,
+    Tuple,
     Type
 )
-import heapq
 
+import requests
 import twitter
 from twitter import TwitterError
 
-from parallel_twitter.error import OutOfKeysError, not_authorized_error, rate_limit_error
+from parallel_twitter.coalescer import LookupCoalescer
+from parallel_twitter.entity_store import EntityStore
+from parallel_twitter.error import (
+    OutOfKeysError,
+    auth_error,
+    key_error,
+    no_match_error,
+    not_authorized_error,
+    rate_limit_error,
+    transient_error
+)
+from parallel_twitter.key_registry import (
+    KeyRegistry,
+    KeySource,
+    api_identity,
+    load_apis
+)
+from parallel_twitter.key_state import KeyLease, KeyStateTable
+from parallel_twitter.profiling import PROFILER, profiled
+from parallel_twitter.retry import RetryPolicy
+from parallel_twitter.snowflake import time_to_snowflake
 from parallel_twitter.twitter_operator import (
     GetFavorites,
     GetFollowerIDs,
@@ -27,6 +54,7 @@ from parallel_twitter.twitter_operator import (
     TwitterOp,
     UsersLookup
 )
+from parallel_twitter.workers import WorkerPool
 
 LOGGER = logging.getLogger(__name__)
 
@@ -42,21 +70,76 @@ class ParallelTwitterClient:
         UsersLookup
     ]
 
-    def __init__(self, apis: List[twitter.Api]):
-        self.operators: Dict[Type[TwitterOp], List[TwitterOp]] = {
-            op: _api_keys_to_ops(apis, op)
-            for op in ParallelTwitterClient.OPERATORS
-        }
-        for op in self.operators:
-            heapq.heapify(self.operators[op])
-        self.last_call = 0.0
+    def __init__(self,
+                 apis: List[twitter.Api],
+                 coalesce_window: float = 0.05,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 key_registry: Optional[KeyRegistry] = None,
+                 entity_store: Optional[EntityStore] = None,
+                 clock: Optional[Callable[[], float]] = None,
+                 sleep: Optional[Callable[[float], None]] = None):
+        """
+        Parameters
+        ----------
+        apis : List[twitter.Api]
+            A list of twitter.Api objects, which can be obtained from
+            `oauth_dicts_to_apis`
+        coalesce_window : float
+            The number of seconds that `get_user` and `get_status` wait to
+            batch concurrent lookups together. Defaults to 0.05. Up to one
+            batch per key is in flight at once.
+        retry_policy : Optional[RetryPolicy]
+            How to retry transient failures. Defaults to `RetryPolicy()`.
+        key_registry : Optional[KeyRegistry]
+            Tracks the health of each API key and quarantines bad keys.
+            Defaults to `KeyRegistry()`.
+        entity_store : Optional[EntityStore]
+            Remembers the users and posts in every response, so that
+            `users_lookup` and `statuses_lookup` skip recently seen IDs.
+            Defaults to `EntityStore()`.
+        clock : Optional[Callable[[], float]]
+            Returns the current time for spacing requests and backing off,
+            e.g. `Replay.clock` to run faster than real time. Rate limit
+            reset times stay on the wall clock. Defaults to `time.time`.
+        sleep : Optional[Callable[[float], None]]
+            Sleeps for a number of seconds on `clock`, e.g. `Replay.sleep`.
+            Defaults to `time.sleep`.
+        """
+        self.key_state = KeyStateTable(
+            [op() for op in ParallelTwitterClient.OPERATORS]
+        )
+        self.last_call: Dict[Type[TwitterOp], float] = defaultdict(float)
         self.n_requests = 0
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.key_registry = key_registry or KeyRegistry()
+        self.entities = EntityStore() if entity_store is None \
+            else entity_store
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.RLock()
+        for api in apis:
+            self.add_api(api)
+        self._hedge_executor = ThreadPoolExecutor(
+            thread_name_prefix='ParallelTwitterClient')
+        # One lookup in flight per key
+        self.user_coalescer = LookupCoalescer(self.users_lookup,
+                                              window=coalesce_window,
+                                              workers=len(self.key_state))
+        self.status_coalescer = LookupCoalescer(self.statuses_lookup,
+                                                window=coalesce_window,
+                                                workers=len(self.key_state))
 
     def _parallel_call(self, fn: Type[TwitterOp], *params: Any) -> Any:
         """
         Return a call using the stored API keys, ordering the API keys
         by the cached API rate limit reset times.
 
+        Keys that fail with a transient error (a timeout or a 5xx response)
+        are retried after a jittered backoff according to `retry_policy`,
+        and keys that fail repeatedly are skipped by their circuit breaker.
+        Errors caused by the request itself, such as a user that does not
+        exist, are raised without trying the other keys.
+
         Raise an `OutOfKeysError` if all cached times were invalid or if
         there are no valid API keys.
 
@@ -67,51 +150,300 @@ class ParallelTwitterClient:
         params : Any
             Parameters to pass to the `TwitterOp`
         """
-        time_since_last = time.time() - self.last_call
-        # Stagger at about `reqs_per_minute` requests per minute per key
-        stagger_rate = 60 / len(self.operators[fn]) / fn.reqs_per_minute
-        if time_since_last < stagger_rate:
-            time.sleep(stagger_rate - time_since_last)
-        self.last_call = time.time()
-
-        self.n_requests += 1
-        if self.n_requests % 100 == 0:
-            LOGGER.info('Executing the {}th request...'.format(self.n_requests))
-
-        attempted_keys: List[TwitterOp] = []
-        for _ in range(len(self.operators[fn])):
-            op = heapq.heappop(self.operators[fn])
-            if op.renewal_time > time.time():
-                LOGGER.info('Renewal time for {0} is {1}'
-                            .format(op, op.renewal_time))
-                time.sleep(op.renewal_time - time.time() + 1)
-            try:
-                result = op.invoke(*params)
-                attempted_keys.append(op)
-                _add_all_to_heap(attempted_keys, self.operators[fn])
-                return result
-            except TwitterError as ex:
-                LOGGER.info('Twitter API error for {0} with params {1}: {2}'
-                            .format(op, params, ex))
-                if not_authorized_error(ex) or rate_limit_error(ex):
-                    attempted_keys.append(op)
-                if not_authorized_error(ex):
-                    # We should ignore requests for users with private accounts
-                    _add_all_to_heap(attempted_keys, self.operators[fn])
-                    return []
-
-        _add_all_to_heap(attempted_keys, self.operators[fn])
+        self._stagger(fn)
+        policy = self.retry_policy
+        for attempt in range(policy.max_retries + 1):
+            if attempt > 0:
+                delay = policy.backoff(attempt)
+                LOGGER.info('Retrying operator {0} in {1:.2f}s (attempt {2})'
+                            .format(fn, delay, attempt))
+                with PROFILER.timer('wait.backoff'):
+                    (self.sleep or time.sleep)(delay)
+            attempted_keys: Set[int] = set()
+            transient = False
+            while True:
+                lease = self._checkout(fn, attempted_keys)
+                if lease is None:
+                    break
+                key_id = lease.key_id
+                attempted_keys.add(key_id)
+                renewal_time = self.key_state.renewal_time(fn, lease.row)
+                if renewal_time > time.time():
+                    LOGGER.info('Renewal time for key {0} is {1}'
+                                .format(key_id, renewal_time))
+                    with PROFILER.timer('wait.rate_limit'):
+                        # Reset times are on the wall clock, already
+                        # compressed during a replay
+                        time.sleep(max(renewal_time - time.time(), 0))
+                        # A second of margin, compressed during a replay
+                        (self.sleep or time.sleep)(1)
+                try:
+                    return self._invoke_operator(fn, lease, params)
+                except TwitterError as ex:
+                    LOGGER.info('Twitter API error for key {0} with params '
+                                '{1}: {2}'.format(key_id, params, ex))
+                    if not_authorized_error(ex):
+                        # We should ignore requests for users with private
+                        # accounts
+                        return []
+                    if rate_limit_error(ex):
+                        continue
+                    if not key_error(ex):
+                        # The request itself is invalid, e.g. the user does
+                        # not exist, so every other key would fail the same
+                        # way
+                        raise
+                    transient = transient or transient_error(ex)
+                except (requests.ConnectionError, requests.Timeout) as ex:
+                    LOGGER.info('Network error for key {0} with params {1}: {2}'
+                                .format(key_id, params, ex))
+                    transient = True
+            if not transient:
+                break
+
         raise OutOfKeysError(
             'Could not find a valid key for operator {0} and params {1}'
             .format(fn, params))
 
+    def _stagger(self, fn: Type[TwitterOp]) -> None:
+        """ Sleep so that requests are spread at about `reqs_per_minute`
+        requests per minute per key. Each endpoint has a separate budget,
+        so requests to different endpoints do not delay each other. """
+        # Looked up on each call, so that patching `time` takes effect
+        clock = self.clock or time.time
+        with self._lock:
+            time_since_last = clock() - self.last_call[fn]
+            stagger_rate = 60 / max(len(self.key_state), 1) \
+                / fn.reqs_per_minute
+            wait = stagger_rate - time_since_last
+            self.last_call[fn] = clock() + max(wait, 0)
+            self.n_requests += 1
+            if self.n_requests % 100 == 0:
+                LOGGER.info('Executing the {}th request...'
+                            .format(self.n_requests))
+        if wait > 0:
+            with PROFILER.timer('wait.stagger'):
+                (self.sleep or time.sleep)(wait)
+
+    def _checkout(self,
+                  fn: Type[TwitterOp],
+                  exclude: Set[int],
+                  ready_only: bool = False) -> Optional[KeyLease]:
+        """
+        Select the key with the earliest renewal time that has not been
+        attempted, is not quarantined and whose circuit breaker is closed,
+        or half-open with its trial request not yet taken. The caller must
+        release it to `key_state`.
+
+        Parameters
+        ----------
+        fn : Type[TwitterOp]
+            The operator class to select a key for
+        exclude : Set[int]
+            The IDs of keys that should not be selected
+        ready_only : bool
+            If True, only select a key that is not rate limited
+        """
+        return self.key_state.checkout(
+            fn,
+            lambda key_id: key_id in exclude
+            or not self.key_registry.available(key_id)
+            or not self.retry_policy.breaker(key_id).allows(),
+            ready_only=ready_only,
+            claim=lambda key_id: self.retry_policy.breaker(key_id).acquire()
+        )
+
+    def _invoke_operator(self,
+                         fn: Type[TwitterOp],
+                         lease: KeyLease,
+                         params: Tuple[Any, ...]) -> Any:
+        """
+        Invoke the operator with the checked out key, hedging the
+        request on a second key if hedging is enabled and the request is
+        slower than usual. Return the first successful result and release
+        all used keys.
+        """
+        delay = self.retry_policy.hedge_delay(fn)
+        if delay is None:
+            try:
+                return self._timed_invoke(fn, lease, params)
+            finally:
+                self.key_state.release(fn, lease)
+
+        primary = self._hedge_executor.submit(self._timed_invoke,
+                                              fn, lease, params)
+        futures = {primary: lease}
+        done, _ = wait([primary], timeout=delay)
+        if not done:
+            backup = self._checkout(fn, {lease.key_id}, ready_only=True)
+            if backup is not None:
+                LOGGER.info('Hedging slow request for key {0} on key {1}'
+                            .format(lease.key_id, backup.key_id))
+                futures[self._hedge_executor.submit(
+                    self._timed_invoke, fn, backup, params
+                )] = backup
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        try:
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        return f.result()
+                    if f is primary or error is None:
+                        error = f.exception()
+            raise error
+        finally:
+            for f, used in futures.items():
+                f.add_done_callback(
+                    lambda _, used=used: self.key_state.release(fn, used))
+
+    def _timed_invoke(self,
+                      fn: Type[TwitterOp],
+                      lease: KeyLease,
+                      params: Tuple[Any, ...]) -> Any:
+        """ Invoke the operator, recording its latency, rate limit, key
+        health and the number of pages and objects returned. Only errors
+        caused by the key or the network, rather than by the request, count
+        against the key's circuit breaker and registry health. """
+        key_id = lease.key_id
+        op = self.key_state.operators[fn]
+        start = time.monotonic()
+        try:
+            with PROFILER.timer('request.' + fn.__name__):
+                result = op.invoke(lease.api, *params)
+        except Exception as ex:
+            # Record failures here rather than in `_parallel_call`, so that
+            # the losing request of a hedged pair is also recorded
+            if key_error(ex):
+                self.retry_policy.breaker(key_id).record_failure()
+                self.key_registry.record_failure(
+                    key_id,
+                    auth_failure=isinstance(ex, TwitterError)
+                    and auth_error(ex))
+            raise
+        finally:
+            self.key_state.refresh(fn, lease)
+        latency = time.monotonic() - start
+        PROFILER.count('pages.' + fn.__name__)
+        # Paged endpoints return the cursors along with the IDs
+        objects = result[-1] if isinstance(result, tuple) else result
+        if isinstance(objects, list):
+            PROFILER.count('objects.' + fn.__name__, len(objects))
+        self.retry_policy.record_latency(fn, latency)
+        self.retry_policy.breaker(key_id).record_success()
+        self.key_registry.record_success(key_id, latency)
+        self.entities.harvest(result, statuses=op.full_statuses)
+        return result
+
+    def add_api(self, api: twitter.Api) -> Optional[int]:
+        """
+        Start distributing requests to an API key. Return the ID assigned to
+        the key, or None if the key could not check its rate limits.
+
+        Parameters
+        ----------
+        api : twitter.Api
+            The API key to add
+        """
+        PROFILER.instrument(api)
+        health = self.key_registry.add(api)
+        try:
+            self.key_state.add(health.key_id, api)
+        except TwitterError as ex:
+            LOGGER.warning('Discarding API key {0}: {1}'
+                           .format(health.key_id, ex))
+            self.key_registry.remove(health.key_id)
+            return None
+        return health.key_id
+
+    def remove_api(self, key_id: int) -> None:
+        """
+        Stop distributing requests to an API key. Requests that are already
+        using the key are allowed to finish.
+
+        Parameters
+        ----------
+        key_id : int
+            The ID returned by `add_api`
+        """
+        self.key_state.remove(key_id)
+        self.key_registry.remove(key_id)
+
+    def reload_keys(self, source: KeySource) -> None:
+        """
+        Replace the API keys with the keys from a JSON file or a callback.
+        Keys that are already in use keep their rate limit and health state.
+
+        Parameters
+        ----------
+        source : KeySource
+            The path to a JSON file or a function returning `twitter.Api`
+            objects. See `key_registry.load_apis`.
+        """
+        apis = load_apis(source)
+        identities = {api_identity(api) for api in apis}
+        for key_id, health in list(self.key_registry.keys.items()):
+            if api_identity(health.api) not in identities:
+                LOGGER.info('Removing API key {}'.format(key_id))
+                self.remove_api(key_id)
+        for api in apis:
+            if self.key_registry.find(api) is None:
+                key_id = self.add_api(api)
+                LOGGER.info('Added API key {}'.format(key_id))
+
+    def watch_keys(self,
+                   source: KeySource,
+                   interval: float = 60.0) -> threading.Event:
+        """
+        Reload the API keys in a background thread whenever the file
+        changes, or every `interval` seconds for a callback. Return an event
+        that stops the thread when set.
+
+        Parameters
+        ----------
+        source : KeySource
+            The path to a JSON file or a function returning `twitter.Api`
+            objects
+        interval : float
+            The number of seconds between checks. Defaults to 60.
+        """
+        stop = threading.Event()
+
+        def modified_time() -> Optional[float]:
+            if callable(source):
+                return None
+            try:
+                return os.stat(source).st_mtime
+            except OSError:
+                return None
+
+        def watch() -> None:
+            last_modified = modified_time()
+            while not stop.wait(interval):
+                modified = modified_time()
+                if not callable(source) and modified == last_modified:
+                    continue
+                last_modified = modified
+                try:
+                    self.reload_keys(source)
+                except (OSError, ValueError, KeyError) as ex:
+                    LOGGER.warning('Could not reload API keys: {}'.format(ex))
+
+        threading.Thread(target=watch, name='KeyWatcher', daemon=True).start()
+        return stop
+
+    @profiled('client.get_followers')
     def get_followers(
             self,
             user_id: Optional[int] = None,
             screen_name: Optional[str] = None,
             min_count: int = 1,
             batch_size: int = 5000,
-            streaming_fn: Optional[Callable[[twitter.User], Any]] = None
+            streaming_fn: Optional[Callable[[twitter.User], Any]] = None,
+            workers: int = 0,
+            worker_kind: str = 'thread',
+            ordered: bool = True
         ) -> List[Any]:
         """
         Make multiple API requests to pull a user's Twitter following.
@@ -134,31 +466,96 @@ class ParallelTwitterClient:
             If specified, this function will be executed on the returned
             users row by row, only holding `batch_size` twitter.User objects
             at a time.
+        workers : int
+            The number of workers to run `streaming_fn` on, so that the next
+            page is pulled while earlier pages are processed. Defaults to 0,
+            which runs it inline before pulling the next page.
+        worker_kind : str
+            Either 'thread' or 'process'. With 'process', `streaming_fn`
+            must be picklable. Defaults to 'thread'.
+        ordered : bool
+            Whether to return the results of `streaming_fn` in the order the
+            users were pulled. Defaults to True.
         """
-        batch_size = min(batch_size, min_count)
-        next_cursor, prev_cursor, fn_result = -1, None, []
-        users_count = 0
-        while True:
-            next_cursor, prev_cursor, user_ids = self._parallel_call(
-                GetFollowerIDs,
-                user_id,
-                screen_name,
-                next_cursor,
-                batch_size
-            )
-            if streaming_fn:
-                users = self.users_lookup(user_ids)
-                stream = [streaming_fn(u) for u in users]
-                fn_result.extend([v for v in stream if v is not None])
-            else:
+        if not streaming_fn:
+            fn_result: List[Any] = []
+            for user_ids in self.iter_follower_ids(user_id=user_id,
+                                                   screen_name=screen_name,
+                                                   max_count=min_count,
+                                                   batch_size=batch_size):
                 fn_result.extend(user_ids)
-            users_count += len(user_ids)
-            if next_cursor == 0 \
-                    or next_cursor == prev_cursor \
-                    or users_count >= min_count:
-                break
-        return fn_result
+            return fn_result
+        stream: List[Any] = []
+        with WorkerPool(streaming_fn,
+                        workers=workers,
+                        kind=worker_kind,
+                        ordered=ordered) as pool:
+            for user_ids in self.iter_follower_ids(user_id=user_id,
+                                                   screen_name=screen_name,
+                                                   max_count=min_count,
+                                                   batch_size=batch_size):
+                pool.submit(self.users_lookup(user_ids))
+                stream.extend(pool.drain())
+            stream.extend(pool.close())
+        return [v for v in stream if v is not None]
+
+    def iter_follower_ids(self,
+                          user_id: Optional[int] = None,
+                          screen_name: Optional[str] = None,
+                          max_count: Optional[int] = None,
+                          batch_size: int = 5000) -> Iterator[List[int]]:
+        """
+        Yield pages of the IDs of the users following the specified user,
+        newest first. Each page is a separate request, so pages are spread
+        across the API keys.
 
+        Parameters
+        ----------
+        user_id : Optional[int]
+            The Twitter ID of the specified user
+        screen_name : Optional[str]
+            The Twitter handle of the specified user
+        max_count : Optional[int]
+            Stop after this many IDs. Defaults to all followers.
+        batch_size : int
+            The number of IDs to request per page, with a maximum of 5000.
+            Defaults to 5000.
+        """
+        return self._iter_id_pages(GetFollowerIDs,
+                                   user_id,
+                                   screen_name,
+                                   max_count,
+                                   batch_size)
+
+    def iter_friend_ids(self,
+                        user_id: Optional[int] = None,
+                        screen_name: Optional[str] = None,
+                        max_count: Optional[int] = None,
+                        batch_size: int = 5000) -> Iterator[List[int]]:
+        """
+        Yield pages of the IDs of the users that the specified user is
+        following. Each page is a separate request, so pages are spread
+        across the API keys.
+
+        Parameters
+        ----------
+        user_id : Optional[int]
+            The Twitter ID of the specified user
+        screen_name : Optional[str]
+            The Twitter handle of the specified user
+        max_count : Optional[int]
+            Stop after this many IDs. Defaults to all friends.
+        batch_size : int
+            The number of IDs to request per page, with a maximum of 5000.
+            Defaults to 5000.
+        """
+        return self._iter_id_pages(GetFriendIDs,
+                                   user_id,
+                                   screen_name,
+                                   max_count,
+                                   batch_size)
+
+    @profiled('client.get_friend_ids')
     def get_friend_ids(self,
                        user_id: Optional[int] = None,
                        screen_name: Optional[str] = None,
@@ -173,13 +570,43 @@ class ParallelTwitterClient:
         screen_name : Optional[str]
             The Twitter handle of the specified user
         max_count : Optional[int]
-            The maximum number of friends to return. Defaults to 5000.
+            The maximum number of friends to return. Defaults to all friends.
         """
-        return self._parallel_call(GetFriendIDs,
-                                   user_id,
-                                   screen_name,
-                                   max_count)
-
+        friends: Set[int] = set()
+        for page in self.iter_friend_ids(user_id=user_id,
+                                         screen_name=screen_name,
+                                         max_count=max_count):
+            friends.update(page)
+        return friends
+
+    def _iter_id_pages(self,
+                       fn: Type[TwitterOp],
+                       user_id: Optional[int],
+                       screen_name: Optional[str],
+                       max_count: Optional[int],
+                       batch_size: int) -> Iterator[List[int]]:
+        """ Yield cursored pages of IDs from `GetFollowerIDs` or
+        `GetFriendIDs`. """
+        next_cursor, prev_cursor = -1, None
+        ids_count = 0
+        while max_count is None or ids_count < max_count:
+            count = batch_size if max_count is None \
+                else min(batch_size, max_count - ids_count)
+            page = self._parallel_call(fn,
+                                       user_id,
+                                       screen_name,
+                                       next_cursor,
+                                       count)
+            if page == []:
+                # The user's account is private
+                return
+            next_cursor, prev_cursor, ids = page
+            ids_count += len(ids)
+            yield ids
+            if next_cursor == 0 or next_cursor == prev_cursor:
+                return
+
+    @profiled('client.get_user_timeline')
     def get_user_timeline(
             self,
             user_id: Optional[int] = None,
@@ -188,7 +615,10 @@ class ParallelTwitterClient:
             include_rts: Optional[bool] = True,
             exclude_replies: Optional[bool] = False,
             min_count: int = 1,
-            max_requests: int = 100000
+            max_requests: int = 100000,
+            since_id: Optional[int] = None,
+            since_time: Optional[float] = None,
+            until_time: Optional[float] = None
     ) -> List[twitter.Status]:
         """
         Return the posts on the specified user's timeline.
@@ -212,9 +642,27 @@ class ParallelTwitterClient:
             increments of 200 per request. Defaults to 1.
         max_requests : int
             The maximum number of API requests to use. Defaults to 100000.
+        since_id : Optional[int]
+            Only return posts newer than the specified ID, which stops paging
+            once they run out. Defaults to None.
+        since_time : Optional[float]
+            Only return posts created at or after this Unix time. Paging
+            stops at the first page that reaches older posts, so a user whose
+            latest post is older costs a single request. Defaults to None.
+        until_time : Optional[float]
+            Only return posts created before this Unix time. Paging starts
+            at the corresponding post ID rather than at the latest post.
+            Defaults to None.
         """
         posts: List[twitter.Status] = []
         max_id: Optional[int] = None
+        if until_time is not None:
+            try:
+                max_id = time_to_snowflake(until_time) - 1
+            except ValueError:
+                # Older posts do not encode their time in their ID, so they
+                # are only filtered by their creation time
+                pass
         calls = 0
         while len(posts) < min_count and calls < max_requests:
             current_posts = self._parallel_call(GetUserTimeline,
@@ -223,7 +671,8 @@ class ParallelTwitterClient:
                                                 trim_user,
                                                 include_rts,
                                                 exclude_replies,
-                                                max_id)
+                                                max_id,
+                                                since_id)
             # Return if there are no unseen posts
             if len(current_posts) == 0 or \
                     len(current_posts) == 1 and current_posts[0].id == max_id:
@@ -232,41 +681,65 @@ class ParallelTwitterClient:
             if current_posts[0].id == max_id:
                 current_posts.pop(0)
             max_id = min(p.id for p in current_posts)
-            posts.extend(current_posts)
             calls += 1
+            if since_time is None and until_time is None:
+                posts.extend(current_posts)
+                continue
+            times = [p.created_at_in_seconds for p in current_posts]
+            posts.extend(p for p, t in zip(current_posts, times)
+                         if (since_time is None or t >= since_time)
+                         and (until_time is None or t < until_time))
+            # Posts are newest first, so later pages are all too old
+            if since_time is not None and min(times) < since_time:
+                return posts
         return posts
 
-    def users_lookup(self, user_ids: List[int]) -> List[twitter.User]:
+    @profiled('client.users_lookup')
+    def users_lookup(self, user_ids: Sequence[int]) -> List[twitter.User]:
         """
-        Return a list of hydrated `User` objects.
+        Return a list of hydrated `User` objects. Users that are fresh in
+        `entities` are not requested again, and users that do not exist are
+        left out.
 
         Parameters
         ----------
-        user_ids : List[int]
-            List of Twitter IDs to hydrate
+        user_ids : Sequence[int]
+            List of Twitter IDs to hydrate, such as an `IdSet`
         """
         if len(user_ids) == 0:
             return []
-        users: List[twitter.User] = []
+        cached = self.entities.users(user_ids)
+        users: List[twitter.User] = list(cached.values())
+        user_ids = [i for i in user_ids if i not in cached]
         for i in range((len(user_ids) - 1) // 100 + 1):
-            users.extend(self._parallel_call(
-                UsersLookup,
-                user_ids[100 * i: 100 * (i + 1)]
-            ))
+            try:
+                users.extend(self._parallel_call(
+                    UsersLookup,
+                    user_ids[100 * i: 100 * (i + 1)]
+                ))
+            except TwitterError as ex:
+                # None of the users in the batch exist
+                if not no_match_error(ex):
+                    raise
         return users
 
-    def statuses_lookup(self, post_ids: List[int]) -> List[twitter.Status]:
+    @profiled('client.statuses_lookup')
+    def statuses_lookup(self,
+                        post_ids: Sequence[int]) -> List[twitter.Status]:
         """
-        Return a list of hydrated `Status` objects.
+        Return a list of hydrated `Status` objects. Posts that are fresh in
+        `entities` are not requested again.
 
         Parameters
         ----------
-        post_ids : List[int]
-            List of Twitter post IDs to hydrate
+        post_ids : Sequence[int]
+            List of Twitter post IDs to hydrate, such as an `IdSet`
         """
         if len(post_ids) == 0:
             return []
-        posts: List[twitter.Status] = []
+        cached = self.entities.statuses(post_ids)
+        posts: List[twitter.Status] = list(cached.values())
+        post_ids = [i for i in post_ids if i not in cached]
         for i in range((len(post_ids) - 1) // 100 + 1):
             posts.extend(self._parallel_call(
                 StatusesLookup,
@@ -274,6 +747,33 @@ class ParallelTwitterClient:
             ))
         return posts
 
+    def get_user(self, user_id: int) -> Optional[twitter.User]:
+        """
+        Return a hydrated `User` object, or None if the user does not exist.
+        Concurrent calls from multiple threads are batched into shared
+        `UsersLookup` requests.
+
+        Parameters
+        ----------
+        user_id : int
+            The Twitter ID of the specified user
+        """
+        return self.user_coalescer.get(user_id)
+
+    def get_status(self, post_id: int) -> Optional[twitter.Status]:
+        """
+        Return a hydrated `Status` object, or None if the post does not exist.
+        Concurrent calls from multiple threads are batched into shared
+        `StatusesLookup` requests.
+
+        Parameters
+        ----------
+        post_id : int
+            The Twitter ID of the specified post
+        """
+        return self.status_coalescer.get(post_id)
+
+    @profiled('client.get_favorites')
     def get_favorites(
             self,
             user_id: Optional[int] = None,
@@ -331,21 +831,3 @@ def oauth_dicts_to_apis(oauth_dicts: List[Dict[str, str]],
         )
     return apis
 
-
-def _add_all_to_heap(lst: List[TwitterOp], heap: List[TwitterOp]) -> None:
-    """ Add all elements to a heap. """
-    for o in lst:
-        heapq.heappush(heap, o)
-
-
-def _api_keys_to_ops(apis: List[twitter.Api],
-                     op: Type[TwitterOp]) -> List[TwitterOp]:
-    """ Map a list of Twitter API keys to a list of `TwitterOp` objects. """
-    ops: List[TwitterOp] = []
-    for k in apis:
-        try:
-            ops.append(op(api=k, unique_id=len(ops)))
-        except TwitterError:
-            # Throw away API keys that have errors.
-            pass
-    return ops
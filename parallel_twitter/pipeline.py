@@ -0,0 +1,276 @@
+""" Pipelines that run several endpoints concurrently. """
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import twitter
+
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.profiling import PROFILER
+
+LOGGER = logging.getLogger(__name__)
+
+# Marks the end of a queue
+_DONE = object()
+
+
+class StageStats:
+    """ Throughput counters for one stage of a pipeline. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.requests = 0
+        self.busy = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float, requests: int = 0) -> None:
+        """
+        Record a unit of work.
+
+        Parameters
+        ----------
+        items : int
+            The number of items the stage produced
+        seconds : float
+            The time spent producing them
+        requests : int
+            The number of API requests made. Defaults to 0.
+        """
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic() - seconds
+            self.items += items
+            self.requests += requests
+            self.busy += seconds
+
+    @property
+    def elapsed(self) -> float:
+        """ Wall-clock seconds between the first and last unit of work. """
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """ Items per wall-clock second. """
+        if self.elapsed == 0:
+            return 0.0
+        return self.items / self.elapsed
+
+    def __repr__(self):
+        return ('StageStats[{0}: items={1}, requests={2}, busy={3:.2f}s, '
+                'throughput={4:.1f}/s]').format(
+                    self.name, self.items, self.requests, self.busy,
+                    self.throughput)
+
+
+class HydrationPipeline:
+    """
+    Turn a list of seed users into hydrated followers or friends.
+
+    Follower or friend IDs are paged for every seed concurrently,
+    deduplicated across seeds, batched into groups of 100 and hydrated with
+    `UsersLookup` by several workers, while a single thread streams the
+    hydrated users to a sink. Since `GetFollowerIDs`/`GetFriendIDs` and
+    `UsersLookup` have separate rate limits, both are used at once.
+    """
+
+    RELATIONS = ('followers', 'friends')
+
+    def __init__(self,
+                 client: ParallelTwitterClient,
+                 relation: str = 'followers',
+                 max_ids_per_seed: Optional[int] = None,
+                 fetch_workers: int = 4,
+                 hydrate_workers: int = 4,
+                 queue_size: int = 100):
+        """
+        Parameters
+        ----------
+        client : ParallelTwitterClient
+            The client to make requests with
+        relation : str
+            Either 'followers' or 'friends'. Defaults to 'followers'.
+        max_ids_per_seed : Optional[int]
+            The maximum number of IDs to pull for each seed. Defaults to
+            all of them.
+        fetch_workers : int
+            The number of seeds to page concurrently. Defaults to 4.
+        hydrate_workers : int
+            The number of concurrent `UsersLookup` requests. Defaults to 4.
+        queue_size : int
+            The number of pages or batches buffered between stages.
+            Defaults to 100.
+        """
+        if relation not in HydrationPipeline.RELATIONS:
+            raise ValueError('relation must be one of {}'
+                             .format(HydrationPipeline.RELATIONS))
+        self.client = client
+        self.relation = relation
+        self.max_ids_per_seed = max_ids_per_seed
+        self.fetch_workers = fetch_workers
+        self.hydrate_workers = hydrate_workers
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {}
+
+    def run(self,
+            seeds: Iterable[int],
+            sink: Callable[[twitter.User], Any]) -> Dict[str, StageStats]:
+        """
+        Run the pipeline and return the statistics of each stage. Raise the
+        first error raised by any stage.
+
+        Parameters
+        ----------
+        seeds : Iterable[int]
+            The Twitter IDs of the seed users
+        sink : Callable[[twitter.User], Any]
+            Called with every hydrated user, from a single thread
+        """
+        self.stats = {name: StageStats(name)
+                      for name in ('fetch', 'dedupe', 'hydrate', 'sink')}
+        ids: queue.Queue = queue.Queue(self.queue_size)
+        batches: queue.Queue = queue.Queue(self.queue_size)
+        users: queue.Queue = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        seen: Set[int] = set()
+        seen_lock = threading.Lock()
+
+        def guarded(fn: Callable[[], None]) -> Callable[[], None]:
+            def run() -> None:
+                try:
+                    fn()
+                except BaseException as ex:  # pylint: disable=broad-except
+                    errors.append(ex)
+                    stop.set()
+            return run
+
+        def fetch_seed(seed: int) -> None:
+            pages = self.client.iter_follower_ids \
+                if self.relation == 'followers' \
+                else self.client.iter_friend_ids
+            start = time.monotonic()
+            for page in pages(user_id=seed, max_count=self.max_ids_per_seed):
+                if stop.is_set():
+                    return
+                self.stats['fetch'].record(len(page),
+                                           time.monotonic() - start,
+                                           requests=1)
+                start = time.monotonic()
+                with seen_lock:
+                    new_ids = [i for i in page if i not in seen]
+                    seen.update(new_ids)
+                self.stats['dedupe'].record(len(new_ids),
+                                            time.monotonic() - start)
+                _put(ids, new_ids, stop)
+                start = time.monotonic()
+
+        def fetch() -> None:
+            try:
+                with ThreadPoolExecutor(self.fetch_workers) as pool:
+                    for f in [pool.submit(guarded(lambda s=s: fetch_seed(s)))
+                              for s in seeds]:
+                        f.result()
+            finally:
+                self.stats['fetch'].finished = time.monotonic()
+                _put(ids, _DONE, stop)
+
+        def batch() -> None:
+            pending: List[int] = []
+            try:
+                while True:
+                    page = _get(ids, stop)
+                    if page is _DONE or page is None:
+                        break
+                    pending.extend(page)
+                    while len(pending) >= 100:
+                        _put(batches, pending[:100], stop)
+                        pending = pending[100:]
+                if len(pending) > 0:
+                    _put(batches, pending, stop)
+            finally:
+                for _ in range(self.hydrate_workers):
+                    _put(batches, _DONE, stop)
+
+        def hydrate() -> None:
+            while True:
+                user_ids = _get(batches, stop)
+                if user_ids is _DONE or user_ids is None:
+                    return
+                start = time.monotonic()
+                hydrated = self.client.users_lookup(user_ids)
+                self.stats['hydrate'].record(len(hydrated),
+                                             time.monotonic() - start,
+                                             requests=1)
+                _put(users, hydrated, stop)
+
+        def hydrate_all() -> None:
+            try:
+                with ThreadPoolExecutor(self.hydrate_workers) as pool:
+                    for f in [pool.submit(guarded(hydrate))
+                              for _ in range(self.hydrate_workers)]:
+                        f.result()
+            finally:
+                self.stats['hydrate'].finished = time.monotonic()
+                _put(users, _DONE, stop)
+
+        threads = [
+            threading.Thread(target=guarded(fetch), name='Pipeline-fetch'),
+            threading.Thread(target=guarded(batch), name='Pipeline-batch'),
+            threading.Thread(target=guarded(hydrate_all),
+                             name='Pipeline-hydrate')
+        ]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                hydrated = _get(users, stop)
+                if hydrated is _DONE or hydrated is None:
+                    break
+                start = time.monotonic()
+                with PROFILER.timer('callback'):
+                    for u in hydrated:
+                        sink(u)
+                self.stats['sink'].record(len(hydrated),
+                                          time.monotonic() - start)
+        except BaseException as ex:
+            errors.append(ex)
+            stop.set()
+        finally:
+            for t in threads:
+                t.join()
+            self.stats['sink'].finished = time.monotonic()
+            self.stats['dedupe'].finished = self.stats['fetch'].finished
+        if len(errors) > 0:
+            raise errors[0]
+        for s in self.stats.values():
+            LOGGER.info(s)
+        return self.stats
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> None:
+    """ Put an item on a bounded queue unless the pipeline stopped. """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    """ Get an item from a queue. Return None if the pipeline stopped. """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
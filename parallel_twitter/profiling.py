@@ -0,0 +1,223 @@
+""" Low-overhead instrumentation to attribute time between the network,
+JSON decoding, model building and user callbacks. """
+
+from contextlib import contextmanager
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Phases recorded inside `twitter.Api`
+TRANSPORT = 'transport'
+JSON_DECODE = 'json_decode'
+
+
+class _NullTimer:
+    """ A timer that does nothing, used while profiling is disabled. """
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """ Times a phase, excluding the time spent in nested phases from the
+    phase's own (exclusive) time. """
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.children = 0.0
+
+    def __enter__(self) -> None:
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1].children += elapsed
+        self.profiler.record(self.name, elapsed, elapsed - self.children)
+
+
+class Profiler:
+    """
+    Collect the number of calls, inclusive time and exclusive time of named
+    phases. Timers are no-ops until the profiler is enabled, and it can be
+    toggled at runtime.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._stats: Dict[str, List[float]] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def timer(self, name: str) -> Any:
+        """
+        Return a context manager that times a phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name: str, total: float, exclusive: float) -> None:
+        """
+        Record one call of a phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase
+        total : float
+            Seconds spent in the phase, including nested phases
+        exclusive : float
+            Seconds spent in the phase itself
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += total
+            stats[2] += exclusive
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increment a counter, such as the number of objects returned.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter
+        n : int
+            The amount to add. Defaults to 1.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        """ Discard the collected timings and counters. """
+        with self._lock:
+            self._stats = {}
+            self._counters = {}
+
+    def summary(self) -> Dict[str, Tuple[int, float, float]]:
+        """ Return the number of calls, inclusive seconds and exclusive
+        seconds of each phase. """
+        with self._lock:
+            return {name: (int(s[0]), s[1], s[2])
+                    for name, s in self._stats.items()}
+
+    def counters(self) -> Dict[str, int]:
+        """ Return the value of each counter. """
+        with self._lock:
+            return dict(self._counters)
+
+    def report(self) -> str:
+        """ Return a table of the phases sorted by exclusive time. """
+        summary = self.summary()
+        total = sum(s[2] for s in summary.values()) or 1.0
+        lines = ['{0:<32} {1:>8} {2:>10} {3:>10} {4:>6}'.format(
+            'phase', 'calls', 'total(s)', 'self(s)', 'self%')]
+        for name, (calls, inclusive, exclusive) in sorted(
+                summary.items(), key=lambda item: -item[1][2]):
+            lines.append('{0:<32} {1:>8} {2:>10.3f} {3:>10.3f} {4:>6.1f}'
+                         .format(name, calls, inclusive, exclusive,
+                                 100 * exclusive / total))
+        for name, value in sorted(self.counters().items()):
+            lines.append('{0:<32} {1:>8}'.format(name, value))
+        return '\n'.join(lines)
+
+    def instrument(self, api: Any) -> None:
+        """
+        Time the HTTP requests and JSON decoding of a `twitter.Api` object.
+        Objects without these methods, such as mocks, are left unchanged.
+
+        Parameters
+        ----------
+        api : Any
+            A `twitter.Api` object
+        """
+        for attr, phase in (('_RequestUrl', TRANSPORT),
+                            ('_ParseAndCheckTwitter', JSON_DECODE)):
+            method = getattr(api, attr, None)
+            if method is None or getattr(method, '_profiled', False):
+                continue
+            setattr(api, attr, self.wrap(phase, method))
+
+    def wrap(self, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        Return a function that times each call of `fn` as a phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase
+        fn : Callable[..., Any]
+            The function to time
+        """
+        @functools.wraps(fn)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            with self.timer(name):
+                return fn(*args, **kwargs)
+        timed._profiled = True  # type: ignore
+        return timed
+
+    def _stack(self) -> List[_Timer]:
+        """ Return the calling thread's stack of running timers. """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+PROFILER = Profiler()
+
+
+def profiled(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorate a function to time it as a phase of the global `PROFILER`.
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        return PROFILER.wrap(name, fn)
+    return decorator
+
+
+@contextmanager
+def profile(profiler: Profiler = PROFILER) -> Iterator[Profiler]:
+    """
+    Enable a profiler for a block of work, starting from empty statistics.
+    Print `profiler.report()` afterwards for a summary.
+
+    Parameters
+    ----------
+    profiler : Profiler
+        The profiler to enable. Defaults to the global `PROFILER`.
+    """
+    enabled = profiler.enabled
+    profiler.reset()
+    profiler.enabled = True
+    try:
+        yield profiler
+    finally:
+        profiler.enabled = enabled
@@ -0,0 +1,297 @@
+""" Record Twitter API traffic and replay it without a network connection. """
+
+from collections import defaultdict, deque
+import gzip
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import requests
+import twitter
+from twitter.ratelimit import EndpointRateLimit
+
+from parallel_twitter.error import ReplayError
+
+LOGGER = logging.getLogger(__name__)
+
+# Models that can be stored in an archive
+MODELS = {
+    'Status': twitter.Status,
+    'User': twitter.User
+}
+
+
+class Recorder:
+    """
+    Record every call made through wrapped `twitter.Api` objects, including
+    rate limit checks, to a gzipped JSON lines archive.
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path : str
+            The path of the archive to write
+        """
+        self.path = path
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._n_keys = 0
+
+    def wrap(self, api: twitter.Api) -> 'RecordingApi':
+        """
+        Return an API object that records the calls made through `api`.
+
+        Parameters
+        ----------
+        api : twitter.Api
+            A Twitter API object
+        """
+        with self._lock:
+            key = self._n_keys
+            self._n_keys += 1
+        return RecordingApi(api, self, key)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """ Append a record to the archive. """
+        line = json.dumps(record, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self) -> None:
+        """ Flush and close the archive. """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class RecordingApi:
+    """ A proxy for `twitter.Api` that records each public method call. """
+
+    def __init__(self, api: twitter.Api, recorder: Recorder, key: int):
+        self._api = api
+        self._recorder = recorder
+        self._key = key
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._api, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def record(*args: Any, **kwargs: Any) -> Any:
+            started = time.time()
+            entry = {
+                'key': self._key,
+                'method': name,
+                'params': _encode_params(args, kwargs),
+                'wall': started
+            }
+            try:
+                result = attr(*args, **kwargs)
+            except twitter.TwitterError as ex:
+                entry['error'] = {'type': 'TwitterError',
+                                  'message': ex.message}
+                raise
+            except requests.RequestException as ex:
+                entry['error'] = {'type': type(ex).__name__,
+                                  'message': str(ex)}
+                raise
+            else:
+                entry['result'] = _encode(result)
+                return result
+            finally:
+                entry['latency'] = time.time() - started
+                self._recorder.write(entry)
+
+        return record
+
+
+class Replay:
+    """
+    Serve the calls in an archive written by `Recorder`. Calls are matched
+    by method name and parameters in the order they were recorded; rate
+    limit checks are also matched by key.
+
+    With a `speed`, each call sleeps for its recorded latency divided by
+    `speed`, and rate limit reset times are compressed by the same factor,
+    so that a 15 minute rate limit window lasts 15 / `speed` minutes. Pass
+    `clock` and `sleep` to `ParallelTwitterClient` so that the spacing
+    between its requests is compressed too.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = None):
+        """
+        Parameters
+        ----------
+        path : str
+            The path of an archive written by `Recorder`
+        speed : Optional[float]
+            How many times faster than recorded to replay. Defaults to None,
+            which replays without delays and with unchanged reset times.
+        """
+        self.speed = speed
+        self.start = time.time()
+        self.n_keys = 0
+        self.record_start: Optional[float] = None
+        self._calls: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = \
+            defaultdict(deque)
+        self._limits: Dict[Tuple[int, str], Deque[Dict[str, Any]]] = \
+            defaultdict(deque)
+        self._last_limit: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if self.record_start is None \
+                        or record['wall'] < self.record_start:
+                    self.record_start = record['wall']
+                self.n_keys = max(self.n_keys, record['key'] + 1)
+                if record['method'] == 'CheckRateLimit':
+                    key = (record['key'], record['params'])
+                    self._limits[key].append(record)
+                else:
+                    key = (record['method'], record['params'])
+                    self._calls[key].append(record)
+
+    def clock(self) -> float:
+        """ Return the replay time, which runs `speed` times faster than
+        the wall clock since the replay started. """
+        now = time.time()
+        if self.speed is None:
+            return now
+        return self.start + (now - self.start) * self.speed
+
+    def sleep(self, seconds: float) -> None:
+        """ Sleep for a number of seconds on the replay clock. Without a
+        `speed`, return immediately. """
+        if self.speed is not None and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def apis(self) -> List['ReplayApi']:
+        """ Return an API object for every key in the archive. """
+        return [ReplayApi(self, key) for key in range(self.n_keys)]
+
+    def serve(self,
+              key: int,
+              method: str,
+              args: Tuple[Any, ...],
+              kwargs: Dict[str, Any]) -> Any:
+        """
+        Return the recorded result of a call or raise the recorded error.
+        Raise a `ReplayError` if the call was not recorded.
+
+        Parameters
+        ----------
+        key : int
+            The index of the API key making the call
+        method : str
+            The name of the `twitter.Api` method
+        args : Tuple[Any, ...]
+            Positional arguments of the call
+        kwargs : Dict[str, Any]
+            Keyword arguments of the call
+        """
+        params = _encode_params(args, kwargs)
+        with self._lock:
+            if method == 'CheckRateLimit':
+                record = self._next_limit(key, params)
+            else:
+                queue = self._calls.get((method, params))
+                if not queue:
+                    raise ReplayError('No recorded call to {0} with {1}'
+                                      .format(method, params))
+                record = queue.popleft()
+        if self.speed is not None and method != 'CheckRateLimit':
+            time.sleep(record['latency'] / self.speed)
+        if 'error' in record:
+            raise _decode_error(record['error'])
+        result = _decode(record['result'])
+        if isinstance(result, EndpointRateLimit):
+            result = result._replace(reset=self._replay_time(result.reset))
+        return result
+
+    def _next_limit(self, key: int, params: str) -> Dict[str, Any]:
+        """ Return the next recorded rate limit check for a key, repeating
+        the last one once they run out. """
+        queue = self._limits.get((key, params))
+        if queue:
+            self._last_limit[(key, params)] = queue.popleft()
+        if (key, params) not in self._last_limit:
+            raise ReplayError('No recorded rate limit for key {0} and {1}'
+                              .format(key, params))
+        return self._last_limit[(key, params)]
+
+    def _replay_time(self, recorded: float) -> float:
+        """ Map a recorded timestamp to the replay clock. """
+        if self.speed is None or recorded == 0 or self.record_start is None:
+            return recorded
+        return self.start + (recorded - self.record_start) / self.speed
+
+
+class ReplayApi:
+    """ A stand-in for `twitter.Api` that serves calls from a `Replay`. """
+
+    def __init__(self, replay: Replay, key: int):
+        self._replay = replay
+        self._key = key
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def serve(*args: Any, **kwargs: Any) -> Any:
+            return self._replay.serve(self._key, name, args, kwargs)
+
+        return serve
+
+    def __repr__(self):
+        return 'ReplayApi[key={}]'.format(self._key)
+
+
+def _encode_params(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    """ Return a canonical string for the parameters of a call. """
+    return json.dumps([list(args), kwargs], sort_keys=True, default=str)
+
+
+def _encode(value: Any) -> Any:
+    """ Convert a result to JSON-serializable values. """
+    if isinstance(value, EndpointRateLimit):
+        return {'__type__': 'EndpointRateLimit', 'data': list(value)}
+    for name, model in MODELS.items():
+        if isinstance(value, model):
+            return {'__type__': name, 'data': value.AsDict()}
+    if isinstance(value, tuple):
+        return {'__type__': 'tuple', 'data': [_encode(v) for v in value]}
+    if isinstance(value, (list, set)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    """ Convert a value written by `_encode` back to a result. """
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict) or '__type__' not in value:
+        return value
+    kind, data = value['__type__'], value['data']
+    if kind == 'EndpointRateLimit':
+        return EndpointRateLimit(*data)
+    if kind == 'tuple':
+        return tuple(_decode(v) for v in data)
+    return MODELS[kind].NewFromJsonDict(data)
+
+
+def _decode_error(error: Dict[str, Any]) -> Exception:
+    """ Return the exception for a recorded error. """
+    if error['type'] == 'TwitterError':
+        return twitter.TwitterError(error['message'])
+    exception = getattr(requests, error['type'], requests.RequestException)
+    return exception(error['message'])
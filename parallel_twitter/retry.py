@@ -0,0 +1,199 @@
+""" Retry, backoff and hedging policies for `ParallelTwitterClient`. """
+
+from collections import deque
+import random
+import threading
+import time
+from typing import Deque, Dict, Hashable, Optional
+
+
+class CircuitBreaker:
+    """
+    Track consecutive failures for an API key. After `failure_threshold`
+    consecutive failures the breaker opens and the key is skipped until
+    `cooldown` seconds have passed. The breaker is then half-open: `acquire`
+    lets a single trial request through, whose success closes the breaker
+    and whose failure opens it again. If the trial records neither, e.g.
+    because the request itself was invalid, another trial is allowed after
+    a further `cooldown`.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0):
+        """
+        Parameters
+        ----------
+        failure_threshold : int
+            The number of consecutive failures before the breaker opens.
+            Defaults to 3.
+        cooldown : float
+            The number of seconds to skip the key once the breaker opens.
+            Defaults to 60.
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allows(self) -> bool:
+        """ Return whether a request may be sent with this key, without
+        taking the trial request of a half-open breaker. """
+        with self._lock:
+            return self._allows(time.time())
+
+    def acquire(self) -> bool:
+        """ Return whether a request may be sent with this key. If the
+        breaker is half-open, the caller takes the trial request. """
+        with self._lock:
+            now = time.time()
+            if not self._allows(now):
+                return False
+            if self.opened_at is not None:
+                self.trial_at = now
+            return True
+
+    def record_success(self) -> None:
+        """ Close the breaker. """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_at = None
+
+    def record_failure(self) -> None:
+        """ Count a failure, opening the breaker if over the threshold. """
+        with self._lock:
+            self.failures += 1
+            self.trial_at = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+    def _allows(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+        if now - self.opened_at < self.cooldown:
+            return False
+        return self.trial_at is None or now - self.trial_at >= self.cooldown
+
+    def __repr__(self):
+        return 'CircuitBreaker[failures={0}, open={1}]'.format(
+            self.failures, self.opened_at is not None)
+
+
+class RetryPolicy:
+    """
+    Decide how `ParallelTwitterClient` retries transient failures: jittered
+    exponential backoff between rounds of keys, per-key circuit breakers,
+    and optional hedged requests that duplicate slow calls on another key.
+    """
+
+    def __init__(self,
+                 max_retries: int = 3,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 failure_threshold: int = 3,
+                 cooldown: float = 60.0,
+                 hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 20,
+                 latency_window: int = 200):
+        """
+        Parameters
+        ----------
+        max_retries : int
+            The number of additional rounds through the keys after every key
+            failed with a transient error. Defaults to 3.
+        base_delay : float
+            The backoff before the first retry in seconds. Defaults to 1.
+        max_delay : float
+            The maximum backoff in seconds. Defaults to 60.
+        failure_threshold : int
+            Consecutive failures before a key's circuit breaker opens.
+            Defaults to 3.
+        cooldown : float
+            Seconds to skip a key once its circuit breaker opens. Defaults
+            to 60.
+        hedge_percentile : Optional[float]
+            If specified, a request that takes longer than this percentile
+            (between 0 and 100) of recent latencies for the same operator is
+            duplicated on another key. Defaults to None, which disables
+            hedging.
+        hedge_min_samples : int
+            The number of latency samples required before hedging.
+            Defaults to 20.
+        latency_window : int
+            The number of recent latencies to keep per operator. Defaults
+            to 200.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency_window = latency_window
+        self._breakers: Dict[Hashable, CircuitBreaker] = {}
+        self._latencies: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return the number of seconds to wait before the given retry, using
+        "full jitter" exponential backoff.
+
+        Parameters
+        ----------
+        attempt : int
+            The retry number, starting at 1
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def breaker(self, key: Hashable) -> CircuitBreaker:
+        """
+        Return the circuit breaker for an API key.
+
+        Parameters
+        ----------
+        key : Hashable
+            An identifier for the API key
+        """
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.failure_threshold,
+                                                     self.cooldown)
+            return self._breakers[key]
+
+    def record_latency(self, operator: Hashable, seconds: float) -> None:
+        """
+        Record the latency of a successful request.
+
+        Parameters
+        ----------
+        operator : Hashable
+            The operator that made the request
+        seconds : float
+            The duration of the request
+        """
+        if operator not in self._latencies:
+            self._latencies[operator] = deque(maxlen=self.latency_window)
+        self._latencies[operator].append(seconds)
+
+    def hedge_delay(self, operator: Hashable) -> Optional[float]:
+        """
+        Return the number of seconds to wait before hedging a request, or
+        None if the request should not be hedged.
+
+        Parameters
+        ----------
+        operator : Hashable
+            The operator making the request
+        """
+        if self.hedge_percentile is None:
+            return None
+        samples = self._latencies.get(operator)
+        if samples is None or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        idx = int(round(self.hedge_percentile / 100 * (len(ordered) - 1)))
+        return ordered[min(max(idx, 0), len(ordered) - 1)]
@@ -0,0 +1,254 @@
+""" Snapshots of users' follower and friend IDs, and the differences
+between runs. """
+
+from array import array
+import itertools
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Iterable, Optional, Tuple
+
+from parallel_twitter.id_set import IdSet
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+LOGGER = logging.getLogger(__name__)
+
+# File header: magic bytes, snapshot time and the number of IDs
+MAGIC = b'PTSNP\x00\x00\x01'
+HEADER = struct.Struct('<8sdQ')
+
+
+class GraphDiff:
+    """ The IDs added to and removed from a user's followers or friends
+    since the previous snapshot. """
+
+    def __init__(self,
+                 user_id: int,
+                 relation: str,
+                 added: IdSet,
+                 removed: IdSet,
+                 complete: bool,
+                 n_requests: int = 0):
+        """
+        Parameters
+        ----------
+        user_id : int
+            The Twitter ID of the user
+        relation : str
+            Either 'followers' or 'friends'
+        added : IdSet
+            IDs that are new since the previous snapshot
+        removed : IdSet
+            IDs that are gone since the previous snapshot
+        complete : bool
+            False if paging stopped early, in which case no removals are
+            detected
+        n_requests : int
+            The number of requests used to pull the IDs
+        """
+        self.user_id = user_id
+        self.relation = relation
+        self.added = added
+        self.removed = removed
+        self.complete = complete
+        self.n_requests = n_requests
+
+    def __repr__(self):
+        return ('GraphDiff[user={0}, {1}: +{2} -{3}, complete={4}, '
+                'requests={5}]').format(self.user_id, self.relation,
+                                        len(self.added), len(self.removed),
+                                        self.complete, self.n_requests)
+
+
+class SnapshotStore:
+    """
+    A directory of follower and friend ID snapshots, one file per user and
+    relation. IDs are stored sorted and delta encoded, then compressed, so
+    large and stable accounts take little space.
+    """
+
+    RELATIONS = ('followers', 'friends')
+
+    def __init__(self, directory: str):
+        """
+        Parameters
+        ----------
+        directory : str
+            The directory to store snapshots in. It is created if necessary.
+        """
+        self.directory = directory
+
+    def path(self, user_id: int, relation: str) -> str:
+        """ Return the path of the snapshot for a user and relation. """
+        if relation not in SnapshotStore.RELATIONS:
+            raise ValueError('relation must be one of {}'
+                             .format(SnapshotStore.RELATIONS))
+        return os.path.join(self.directory, relation,
+                            '{}.snapshot'.format(user_id))
+
+    def load(self,
+             user_id: int,
+             relation: str) -> Optional[Tuple[float, IdSet]]:
+        """
+        Return the time and IDs of the latest snapshot, or None if there is
+        no snapshot.
+
+        Parameters
+        ----------
+        user_id : int
+            The Twitter ID of the user
+        relation : str
+            Either 'followers' or 'friends'
+        """
+        path = self.path(user_id, relation)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            magic, taken_at, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a snapshot file'.format(path))
+            deltas = array('q', zlib.decompress(f.read()))
+        if len(deltas) != count:
+            raise ValueError('{} is truncated'.format(path))
+        return taken_at, IdSet(array('q', itertools.accumulate(deltas)))
+
+    def save(self,
+             user_id: int,
+             relation: str,
+             ids: Iterable[int],
+             taken_at: Optional[float] = None) -> IdSet:
+        """
+        Replace the snapshot for a user and relation. Return the IDs as an
+        `IdSet`.
+
+        Parameters
+        ----------
+        user_id : int
+            The Twitter ID of the user
+        relation : str
+            Either 'followers' or 'friends'
+        ids : Iterable[int]
+            The user's follower or friend IDs
+        taken_at : Optional[float]
+            The time the IDs were pulled. Defaults to now.
+        """
+        id_set = IdSet.from_iterable(ids)
+        path = self.path(user_id, relation)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        deltas = array('q', (b - a for a, b in
+                             zip(itertools.chain([0], id_set), id_set)))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC,
+                                time.time() if taken_at is None else taken_at,
+                                len(id_set)))
+            f.write(zlib.compress(deltas.tobytes()))
+        # Replace atomically so that a crash never leaves a partial snapshot
+        os.replace(tmp_path, path)
+        return id_set
+
+    def diff(self,
+             user_id: int,
+             relation: str,
+             ids: Iterable[int]) -> GraphDiff:
+        """
+        Return the difference between the latest snapshot and the IDs,
+        without saving them. If there is no snapshot, every ID is added.
+
+        Parameters
+        ----------
+        user_id : int
+            The Twitter ID of the user
+        relation : str
+            Either 'followers' or 'friends'
+        ids : Iterable[int]
+            The user's current follower or friend IDs
+        """
+        current = IdSet.from_iterable(ids)
+        previous = self.load(user_id, relation)
+        if previous is None:
+            return GraphDiff(user_id, relation, current,
+                             IdSet.from_iterable([]), complete=True)
+        _, previous_ids = previous
+        return GraphDiff(user_id, relation,
+                         current - previous_ids,
+                         previous_ids - current,
+                         complete=True)
+
+    def update(self,
+               client: ParallelTwitterClient,
+               user_id: int,
+               relation: str = 'followers',
+               early_stop: bool = True,
+               batch_size: int = 5000) -> GraphDiff:
+        """
+        Pull a user's follower or friend IDs, save them as the new snapshot
+        and return the difference from the previous snapshot.
+
+        The API returns the newest IDs first, so with `early_stop` paging
+        stops at the first page whose IDs are all in the previous snapshot,
+        and the rest of the previous snapshot is assumed unchanged. This
+        saves most requests for large, stable accounts, but a diff that
+        stopped early reports no removals at all, since the snapshot does
+        not record which IDs were in the pulled pages. Run with
+        `early_stop=False` periodically to find removals.
+
+        If the account is private, nothing is pulled: the previous snapshot
+        is kept and the difference is empty and incomplete.
+
+        Parameters
+        ----------
+        client : ParallelTwitterClient
+            The client to make requests with
+        user_id : int
+            The Twitter ID of the user
+        relation : str
+            Either 'followers' or 'friends'. Defaults to 'followers'.
+        early_stop : bool
+            Whether to stop paging once a page was fully in the previous
+            snapshot. Defaults to True.
+        batch_size : int
+            The number of IDs to request per page. Defaults to 5000.
+        """
+        previous = self.load(user_id, relation)
+        previous_ids = previous[1] if previous is not None else None
+        pages = client.iter_follower_ids if relation == 'followers' \
+            else client.iter_friend_ids
+        pulled = []
+        n_requests = 0
+        complete = True
+        for page in pages(user_id=user_id, batch_size=batch_size):
+            n_requests += 1
+            pulled.extend(page)
+            # An empty page says nothing about whether the rest is unchanged
+            if early_stop and previous_ids is not None and len(page) > 0 \
+                    and all(i in previous_ids for i in page):
+                complete = False
+                break
+        if n_requests == 0:
+            # Nothing was pulled because the account is private, so keep
+            # the previous snapshot rather than report every ID as removed
+            diff = GraphDiff(user_id, relation, IdSet.from_iterable([]),
+                             IdSet.from_iterable([]), False, n_requests)
+            LOGGER.info(diff)
+            return diff
+        current = IdSet.from_iterable(pulled)
+        if previous_ids is None:
+            diff = GraphDiff(user_id, relation, current,
+                             IdSet.from_iterable([]), True, n_requests)
+        elif complete:
+            diff = GraphDiff(user_id, relation,
+                             current - previous_ids,
+                             previous_ids - current,
+                             True, n_requests)
+        else:
+            diff = GraphDiff(user_id, relation,
+                             current - previous_ids,
+                             IdSet.from_iterable([]),
+                             False, n_requests)
+            current = current | previous_ids
+        self.save(user_id, relation, current)
+        LOGGER.info(diff)
+        return diff
@@ -0,0 +1,36 @@
+""" Convert between post IDs and the times they were created at. """
+
+# Post IDs created since November 2010 are Snowflake IDs, whose top bits
+# are the creation time in milliseconds since this epoch
+SNOWFLAKE_EPOCH_MS = 1288834974657
+TIMESTAMP_SHIFT = 22
+
+
+def time_to_snowflake(unix_time: float) -> int:
+    """
+    Return the smallest post ID that could have been created at or after a
+    time. Raise a `ValueError` for times before Snowflake IDs were used.
+
+    Parameters
+    ----------
+    unix_time : float
+        Seconds since the Unix epoch
+    """
+    ms = int(unix_time * 1000) - SNOWFLAKE_EPOCH_MS
+    if ms < 0:
+        raise ValueError('{} is before Snowflake IDs were used'
+                         .format(unix_time))
+    return ms << TIMESTAMP_SHIFT
+
+
+def snowflake_to_time(post_id: int) -> float:
+    """
+    Return the time a post with a Snowflake ID was created, in seconds
+    since the Unix epoch.
+
+    Parameters
+    ----------
+    post_id : int
+        A post ID
+    """
+    return ((post_id >> TIMESTAMP_SHIFT) + SNOWFLAKE_EPOCH_MS) / 1000
@@ -0,0 +1,59 @@
+""" Tests for refreshing known posts. """
+
+from unittest.mock import patch
+
+import pytest
+
+from parallel_twitter.backfill import plan_backfill, run_backfill
+from parallel_twitter.mock_api import MockTimelineApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+
+def test_plan_pages_dense_timelines():
+    posts = {1: range(1000, 1400), 2: range(2000, 2010)}
+    plan = plan_backfill(posts, post_ids=[5, 6])
+    assert list(plan.timelines) == [1]
+    assert plan.timeline_requests == 2
+    assert plan.lookups == [5, 6] + list(range(2000, 2010))
+    assert plan.lookup_requests == 1
+
+
+def test_plan_looks_up_sparse_posts():
+    plan = plan_backfill({1: range(1000, 1400)}, density=0.25)
+    assert plan.timelines == {}
+    assert plan.lookup_requests == 4
+    with pytest.raises(ValueError):
+        plan_backfill({1: range(10)}, density=0)
+
+
+def test_plan_balances_endpoints():
+    # Paging the second user takes more requests than looking its posts up,
+    # but the timeline endpoint would otherwise be idle
+    posts = {1: range(1000, 1400), 2: range(2000, 2300)}
+    plan = plan_backfill(posts, density=0.25)
+    assert list(plan.timelines) == [2]
+    assert plan.timeline_requests == 6
+    assert plan.lookup_requests == 4
+
+
+def test_plan_skips_posts_beyond_timeline_limit():
+    plan = plan_backfill({1: range(4000)})
+    assert plan.timelines == {}
+    assert plan.lookup_requests == 40
+
+
+@patch('time.sleep')
+def test_run_backfill(mock_sleep):
+    api = MockTimelineApi({1: [19, 18, 17, 16, 15, 14, 12, 11], 2: [29, 28]},
+                          page_size=2)
+    p = ParallelTwitterClient(apis=[api])
+    plan = plan_backfill({1: [19, 17, 16, 13]}, post_ids=[28])
+    plan.timelines = {1: [19, 17, 16, 13]}
+    plan.lookups = [28]
+    refreshed = run_backfill(p, plan, workers=2)
+    assert sorted(refreshed) == [16, 17, 19, 28]
+    assert refreshed[17].favorite_count == 17 % 7
+    # Paging stops after the oldest known post, and the deleted post 13 is
+    # looked up after the timeline did not return it
+    assert len(api.timeline_calls) == 6
+    assert sorted(api.calls) == [[13], [28]]
@@ -0,0 +1,81 @@
+""" Tests for coalescing concurrent lookups. """
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from parallel_twitter.coalescer import LookupCoalescer
+from parallel_twitter.mock_api import MockLookupApi, MockMissingLookupApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+
+def test_coalescer_batches_concurrent_lookups():
+    api = MockLookupApi()
+    p = ParallelTwitterClient(apis=[api], coalesce_window=0.2)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        users = list(pool.map(p.get_user, range(20)))
+    assert [u.id for u in users] == list(range(20))
+    assert len(api.calls) == 1
+    assert sorted(api.calls[0]) == list(range(20))
+
+
+def test_coalescer_deduplicates_ids():
+    calls = []
+
+    def lookup(ids):
+        calls.append(ids)
+        return [SimpleNamespace(id=i) for i in ids]
+
+    c = LookupCoalescer(lookup, window=0.1)
+    first, second = c.submit(7), c.submit(7)
+    assert first is second
+    assert first.result().id == 7
+    c.close()
+    assert calls == [[7]]
+
+
+def test_coalescer_flushes_full_batches():
+    calls = []
+
+    def lookup(ids):
+        calls.append(ids)
+        return [SimpleNamespace(id=i) for i in ids if i % 2 == 0]
+
+    c = LookupCoalescer(lookup, window=60, batch_size=10)
+    results = c.lookup(list(range(10)))
+    assert [r.id for r in results] == [0, 2, 4, 6, 8]
+    assert len(calls) == 1
+
+
+def test_coalescer_propagates_errors():
+    def lookup(ids):
+        raise ValueError('boom')
+
+    c = LookupCoalescer(lookup, window=0)
+    with pytest.raises(ValueError):
+        c.get(1)
+
+
+def test_coalescer_runs_batches_concurrently():
+    # Each call waits for the other, so both must be in flight at once
+    barrier = threading.Barrier(2, timeout=1)
+
+    def lookup(ids):
+        barrier.wait()
+        return [SimpleNamespace(id=i) for i in ids]
+
+    c = LookupCoalescer(lookup, window=0, batch_size=1, workers=2)
+    assert [r.id for r in c.lookup([1, 2])] == [1, 2]
+    c.close()
+
+
+@patch('time.sleep')
+def test_missing_users_resolve_to_none(mock_sleep):
+    api = MockMissingLookupApi([123])
+    p = ParallelTwitterClient(apis=[api], coalesce_window=0)
+    assert p.get_user(123) is None
+    assert p.users_lookup([123]) == []
+    assert [u.id for u in p.users_lookup([123, 5])] == [5]
@@ -0,0 +1,67 @@
+""" Tests for prioritized graph crawls. """
+
+from unittest.mock import patch
+
+import pytest
+
+from parallel_twitter import examples
+from parallel_twitter.crawl import (
+    HydratedFollowers,
+    InGroupFollowers,
+    prioritized_crawl
+)
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+# Users 1 and 2 both follow 20, which follows 30; 10 is followed once
+GRAPH = {1: [10, 20], 2: [20], 10: [11], 20: [30]}
+
+
+@patch('time.sleep')
+def test_in_group_priority_expands_popular_users_first(mock_sleep):
+    api = MockGraphApi(GRAPH)
+    p = ParallelTwitterClient(apis=[api])
+    counts = prioritized_crawl(p, [1, 2], depth=2,
+                               priority=InGroupFollowers(),
+                               max_requests=3)
+    # The seeds and then user 20 are expanded, but not user 10
+    assert counts == {10: 1, 20: 2, 30: 1}
+
+
+@patch('time.sleep')
+def test_full_crawl_matches_breadth_first_search(mock_sleep):
+    api = MockGraphApi(GRAPH)
+    p = ParallelTwitterClient(apis=[api])
+    counts = prioritized_crawl(p, [1, 2], depth=2,
+                               priority=HydratedFollowers(p))
+    assert counts == {10: 1, 11: 1, 20: 2, 30: 1}
+
+
+@patch('time.sleep')
+@patch('parallel_twitter.examples.ParallelTwitterClient')
+def test_industry_group_budget(mock_client, mock_sleep):
+    mock_client.return_value = ParallelTwitterClient(
+        apis=[MockGraphApi(GRAPH)])
+    counts = examples.calculate_industry_group([1, 2], depth=2, apis=[],
+                                               max_requests=2)
+    assert counts == {10: 1, 20: 2}
+    counts = examples.calculate_industry_group([1, 2], depth=2, apis=[],
+                                               priority='in_group')
+    assert counts == {10: 1, 11: 1, 20: 2, 30: 1}
+
+
+@patch('time.sleep')
+def test_seeds_followed_by_other_seeds_are_expanded_first(mock_sleep):
+    # Seed 1 follows seed 2, which must not lose its place to user 10
+    api = MockGraphApi({1: [10, 2], 2: [20], 10: [11]})
+    p = ParallelTwitterClient(apis=[api])
+    counts = prioritized_crawl(p, [1, 2], depth=2,
+                               priority=InGroupFollowers(),
+                               max_requests=2)
+    assert counts == {2: 1, 10: 1, 20: 1}
+
+
+def test_industry_group_rejects_unknown_priority():
+    with pytest.raises(ValueError):
+        examples.calculate_industry_group([1], depth=1, apis=[],
+                                          priority='foo')
@@ -0,0 +1,121 @@
+""" Tests for the job queue and daemon. """
+
+import json
+import time
+from unittest.mock import patch
+
+from parallel_twitter.__main__ import main
+from parallel_twitter.daemon import Daemon, JobQueue, JsonLinesSink, Sink
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, job, rows):
+        self.rows.extend((job.job_id, r) for r in rows)
+
+
+def test_queue_claims_jobs_in_order(tmpdir):
+    queue = JobQueue(str(tmpdir.join('jobs.db')))
+    first = queue.put('lookup', {'user_ids': [1]})
+    queue.put('lookup', {'user_ids': [2]})
+    job = queue.claim()
+    assert (job.job_id, job.params, job.attempts) == \
+        (first, {'user_ids': [1]}, 1)
+    queue.fail(job, 'error', retry=True)
+    assert queue.claim().job_id == first
+    assert queue.claim().job_id == first + 1
+    assert queue.claim() is None
+    assert queue.counts() == {'running': 2}
+    # Jobs left running by a stopped worker are claimed again once their
+    # leases expire
+    reopened = JobQueue(queue.path)
+    assert reopened.requeue_expired() == 0
+    with patch('time.time', return_value=time.time() + queue.lease_time + 1):
+        assert reopened.requeue_expired() == 2
+        job = reopened.claim()
+    assert job.attempts == 3
+    reopened.complete(job)
+    assert reopened.counts() == {'done': 1, 'pending': 1}
+
+
+def test_queue_leases_jobs_to_one_worker(tmpdir):
+    path = str(tmpdir.join('jobs.db'))
+    first = JobQueue(path, lease_time=10, worker='first')
+    second = JobQueue(path, lease_time=10, worker='second')
+    first.put('lookup', {})
+    job = first.claim()
+    # Another live worker does not take over the running job
+    assert second.requeue_expired() == 0
+    assert second.claim() is None
+    now = time.time()
+    with patch('time.time', return_value=now + 5):
+        assert first.heartbeat() == 1
+    with patch('time.time', return_value=now + 12):
+        assert second.claim() is None
+    with patch('time.time', return_value=now + 20):
+        taken = second.claim()
+    assert (taken.job_id, taken.attempts) == (job.job_id, 2)
+    # The first worker lost its lease, so its outcome is ignored
+    first.complete(job)
+    assert second.counts() == {'running': 1}
+    second.complete(taken)
+    assert second.counts() == {'done': 1}
+
+
+@patch('time.sleep')
+def test_daemon_runs_jobs(mock_sleep, tmpdir):
+    queue = JobQueue(str(tmpdir.join('jobs.db')))
+    lookup = queue.put('lookup', {'user_ids': [1, 2]})
+    followers = queue.put('followers', {'user_id': 1})
+    crawl = queue.put('crawl', {'seed': [1], 'depth': 1})
+    unknown = queue.put('unknown', {})
+    client = ParallelTwitterClient(apis=[MockGraphApi({1: [2, 3], 2: [3]})])
+    sink = ListSink()
+    Daemon(client, queue, [sink], workers=2, poll_interval=0.01).run(
+        exit_when_empty=True)
+    assert queue.counts() == {'done': 3, 'failed': 1}
+    rows = {}
+    for job_id, row in sink.rows:
+        rows.setdefault(job_id, []).append(row)
+    assert sorted(r['id'] for r in rows[lookup]) == [1, 2]
+    assert rows[followers] == [{'id': 2, 'followed': 1},
+                               {'id': 3, 'followed': 1}]
+    assert {r['id']: r['n_followers'] for r in rows[crawl]} == {2: 1, 3: 2}
+    assert unknown not in rows
+
+
+@patch('time.sleep')
+def test_daemon_retries_failed_jobs(mock_sleep, tmpdir):
+    queue = JobQueue(str(tmpdir.join('jobs.db')))
+    queue.put('timeline', {})
+    client = ParallelTwitterClient(apis=[MockGraphApi({})])
+    Daemon(client, queue, [], poll_interval=0.01, max_attempts=2).run(
+        exit_when_empty=True)
+    job = queue._conn.execute('SELECT status, attempts, error FROM jobs') \
+        .fetchone()
+    assert job == ('failed', 2, "KeyError: 'user_id'")
+
+
+def test_main_submits_jobs(tmpdir, capsys):
+    db = str(tmpdir.join('jobs.db'))
+    main(['submit', '--queue', db, 'lookup', '{"user_ids": [1]}'])
+    main(['status', '--queue', db])
+    out = capsys.readouterr().out.split('\n')
+    assert out[0] == '1'
+    assert json.loads(out[1]) == {'pending': 1}
+
+
+def test_json_lines_sink(tmpdir):
+    path = str(tmpdir.join('out.jsonl'))
+    queue = JobQueue(str(tmpdir.join('jobs.db')))
+    queue.put('lookup', {})
+    sink = JsonLinesSink(path)
+    sink.write(queue.claim(), [{'id': 1}])
+    sink.close()
+    with open(path) as f:
+        assert json.loads(f.read()) == {'id': 1, 'job_id': 1,
+                                        'kind': 'lookup'}
@@ -0,0 +1,83 @@
+""" Tests for sharing users and posts between requests. """
+
+from unittest.mock import patch
+
+import twitter
+
+from parallel_twitter.entity_store import EntityStore
+from parallel_twitter.mock_api import (
+    MockFavoritesApi,
+    MockLookupApi,
+    MockTimelineApi
+)
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+
+def full_user(user_id: int) -> twitter.User:
+    return twitter.User(id=user_id, screen_name='user{}'.format(user_id))
+
+
+def test_harvest_embedded_objects():
+    store = EntityStore()
+    retweeted = twitter.Status(id=2, user=full_user(20))
+    store.harvest([twitter.Status(id=1,
+                                  user=full_user(10),
+                                  retweeted_status=retweeted),
+                   twitter.Status(id=3, user=twitter.User(id=30))])
+    store.harvest([1, 2, 3])
+    assert sorted(store.users([10, 20, 30])) == [10, 20]
+    assert sorted(store.statuses([1, 2, 3])) == [1, 2]
+    assert store.statuses([2])[2] is retweeted
+    assert len(store) == 4
+
+
+def test_store_is_bounded():
+    store = EntityStore(max_users=2)
+    store.harvest([full_user(i) for i in range(3)])
+    store.harvest([full_user(1)])
+    store.harvest([full_user(3)])
+    assert sorted(store.users(range(4))) == [1, 3]
+
+
+@patch('time.monotonic')
+def test_store_expires_objects(mock_monotonic):
+    mock_monotonic.return_value = 100
+    store = EntityStore(max_age=60)
+    store.harvest([full_user(1)])
+    mock_monotonic.return_value = 150
+    assert list(store.users([1])) == [1]
+    mock_monotonic.return_value = 161
+    assert store.users([1]) == {}
+
+
+@patch('time.sleep')
+def test_client_serves_lookups_from_store(mock_sleep):
+    api = MockLookupApi()
+    p = ParallelTwitterClient(apis=[api])
+    p.users_lookup([1, 2])
+    users = p.users_lookup([2, 3, 1])
+    assert sorted(u.id for u in users) == [1, 2, 3]
+    assert api.calls == [[1, 2], [3]]
+    assert p.get_user(2).id == 2
+    assert len(api.calls) == 2
+
+
+@patch('time.sleep')
+def test_client_does_not_store_trimmed_users(mock_sleep):
+    api = MockTimelineApi({1: [11, 12]})
+    p = ParallelTwitterClient(apis=[api])
+    p.get_user_timeline(user_id=1, trim_user=True)
+    p.statuses_lookup([11])
+    assert api.calls == [[11]]
+
+
+@patch('time.sleep')
+def test_client_does_not_serve_liked_posts_as_lookups(mock_sleep):
+    # Likes are requested without entities, which lookups must include
+    api = MockFavoritesApi({1: [11]})
+    p = ParallelTwitterClient(apis=[api])
+    p.get_favorites(user_id=1)
+    p.statuses_lookup([11])
+    assert api.calls == [[11]]
+    assert p.get_user(11).id == 11
+    assert len(api.calls) == 1
@@ -0,0 +1,46 @@
+""" Tests for memory-mappable ID sets. """
+
+import pickle
+
+from parallel_twitter.id_set import IdSet, read_ids, write_ids
+from parallel_twitter.mock_api import MockLookupApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+
+
+def test_id_set_round_trip(tmp_path):
+    path = str(tmp_path / 'seed.ids')
+    written = write_ids(path, [5, 3, 2 ** 62, 3, 1])
+    loaded = read_ids(path)
+    assert loaded == written
+    assert list(loaded) == [1, 3, 5, 2 ** 62]
+    assert 2 ** 62 in loaded
+    assert 4 not in loaded
+
+
+def test_empty_id_set_round_trip(tmp_path):
+    path = str(tmp_path / 'empty.ids')
+    write_ids(path, [])
+    assert len(read_ids(path)) == 0
+
+
+def test_id_set_operations():
+    a = IdSet.from_iterable([1, 2, 3, 4])
+    b = IdSet.from_iterable([3, 4, 5])
+    assert list(a | b) == [1, 2, 3, 4, 5]
+    assert list(a - b) == [1, 2]
+    assert list(a & b) == [3, 4]
+    assert list(a - [1]) == [2, 3, 4]
+
+
+def test_read_legacy_pickle(tmp_path):
+    path = str(tmp_path / 'seed.pickle')
+    with open(path, 'wb') as f:
+        pickle.dump([3, 1, 2], f)
+    assert read_ids(path).to_list() == [1, 2, 3]
+
+
+def test_users_lookup_accepts_id_set():
+    api = MockLookupApi()
+    p = ParallelTwitterClient(apis=[api])
+    users = p.users_lookup(IdSet.from_iterable(range(50)))
+    assert [u.id for u in users] == list(range(50))
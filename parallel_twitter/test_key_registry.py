@@ -0,0 +1,73 @@
+""" Tests for API key health tracking and reloading. """
+
+import json
+from unittest.mock import patch
+
+import pytest
+import twitter
+
+from parallel_twitter.key_registry import KeyRegistry, load_apis
+from parallel_twitter.mock_api import (
+    MockMissingUserApi,
+    MockRevokedApi,
+    MockValidApi
+)
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.twitter_operator import GetFriendIDs
+
+
+@patch('time.sleep')
+def test_revoked_key_is_quarantined(mock_sleep):
+    revoked = MockRevokedApi()
+    p = ParallelTwitterClient(apis=[revoked, MockValidApi(['kanyewest'])])
+    assert p.get_friend_ids(screen_name='jack') == {'kanyewest'}
+    assert p.get_friend_ids(screen_name='jack') == {'kanyewest'}
+    assert revoked.n_calls == 1
+    assert [h.api for h in p.key_registry.unhealthy()] == [revoked]
+
+
+def test_error_rate_quarantine():
+    registry = KeyRegistry(max_error_rate=0.5, min_requests=4)
+    key_id = registry.add(MockValidApi([])).key_id
+    registry.record_success(key_id, 0.1)
+    registry.record_failure(key_id)
+    registry.record_failure(key_id)
+    assert registry.available(key_id)
+    registry.record_failure(key_id)
+    assert not registry.available(key_id)
+
+
+def test_reload_keys_keeps_existing_state():
+    first, second, third = (MockValidApi([]) for _ in range(3))
+    p = ParallelTwitterClient(apis=[first, second])
+    row = p.key_state.rows[p.key_registry.find(first)]
+    p.key_state.reset[GetFriendIDs][row] = 5
+    p.reload_keys(lambda: [first, third])
+    assert {a for a in p.key_state.apis if a is not None} == {first, third}
+    assert p.key_state.rows[p.key_registry.find(first)] == row
+    assert p.key_state.reset[GetFriendIDs][row] == 5
+
+
+def test_load_apis_from_file(tmp_path):
+    path = tmp_path / 'keys.json'
+    path.write_text(json.dumps({
+        'consumer_key': 'key',
+        'consumer_secret': 'secret',
+        'oauth': [{'oauth_token': 'a', 'oauth_token_secret': 'b'}]
+    }))
+    apis = load_apis(str(path))
+    assert len(apis) == 1
+    assert isinstance(apis[0], twitter.Api)
+
+
+@patch('time.sleep')
+def test_bad_requests_do_not_quarantine_keys(mock_sleep):
+    api = MockMissingUserApi([0], ['kanyewest'])
+    registry = KeyRegistry(max_error_rate=0.5, min_requests=2)
+    p = ParallelTwitterClient(apis=[api], key_registry=registry)
+    for _ in range(3):
+        with pytest.raises(twitter.TwitterError):
+            p.get_friend_ids(user_id=0)
+    assert registry.unhealthy() == []
+    assert all(h.n_errors == 0 for h in registry.keys.values())
+    assert p.get_friend_ids(user_id=5) == {'kanyewest'}
@@ -0,0 +1,57 @@
+""" Tests for the per-key rate limit state table. """
+
+from concurrent.futures import ThreadPoolExecutor
+
+from parallel_twitter.key_state import KeyStateTable
+from parallel_twitter.mock_api import MockBlockedApi, MockValidApi
+from parallel_twitter.twitter_operator import GetFriendIDs, UsersLookup
+
+
+def _never(key_id):
+    return False
+
+
+def test_checkout_prefers_earliest_renewal():
+    table = KeyStateTable([GetFriendIDs(), UsersLookup()])
+    table.add(0, MockBlockedApi(10 ** 12))
+    table.add(1, MockValidApi([]))
+    lease = table.checkout(GetFriendIDs, _never)
+    assert lease.key_id == table.key_ids[lease.row] == 1
+    assert table.checkout(GetFriendIDs, _never, ready_only=True) is None
+    table.release(GetFriendIDs, lease)
+    assert table.checkout(GetFriendIDs, _never) == lease
+
+
+def test_removed_rows_are_reused_without_stale_entries():
+    table = KeyStateTable([GetFriendIDs()])
+    table.add(0, MockValidApi([]))
+    table.remove(0)
+    row = table.add(1, MockValidApi([]))
+    assert row == 0
+    assert len(table) == 1
+    assert table.checkout(GetFriendIDs, _never).row == row
+    # The only key is in use, but cannot serve this caller either way
+    assert table.checkout(GetFriendIDs, lambda key_id: key_id == 1) is None
+
+
+def test_checkout_waits_for_key_in_use():
+    table = KeyStateTable([GetFriendIDs()])
+    table.add(0, MockValidApi([]))
+    lease = table.checkout(GetFriendIDs, _never)
+    waiter = ThreadPoolExecutor(1).submit(table.checkout, GetFriendIDs, _never)
+    assert not waiter.done()
+    assert table.checkout(GetFriendIDs, _never, ready_only=True) is None
+    table.release(GetFriendIDs, lease)
+    assert waiter.result(timeout=1) == lease
+
+
+def test_release_after_remove_drops_key():
+    table = KeyStateTable([GetFriendIDs()])
+    api = MockValidApi([])
+    table.add(0, api)
+    lease = table.checkout(GetFriendIDs, _never)
+    table.remove(0)
+    # The request that holds the key can still use it
+    assert lease.api is api
+    table.release(GetFriendIDs, lease)
+    assert table.checkout(GetFriendIDs, _never) is None
@@ -1,11 +1,15 @@
 """ Tests for the parallel Twitter client. """
 
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
 import pytest
 from unittest.mock import patch
 
 from parallel_twitter.error import OutOfKeysError
 from parallel_twitter.mock_api import *
 from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.snowflake import snowflake_to_time, time_to_snowflake
 
 
 @patch('twitter.Api')
@@ -60,3 +64,74 @@ def test_parallel_client_staggers_requests(mock_sleep, mock_time, mock_twitter):
     p.get_friend_ids(screen_name='jack')
     assert mock_sleep.called
 
+
+@patch('time.sleep')
+def test_parallel_client_pages_friend_ids(mock_sleep):
+    api = MockPagedApi([[1, 2], [3, 4], [5]])
+    p = ParallelTwitterClient(apis=[api])
+    assert p.get_friend_ids(user_id=1) == {1, 2, 3, 4, 5}
+    assert api.cursors == [-1, 1, 2]
+
+
+@patch('time.sleep')
+def test_parallel_client_friend_ids_max_count(mock_sleep):
+    api = MockPagedApi([[1, 2], [3, 4], [5]])
+    p = ParallelTwitterClient(apis=[api])
+    pages = list(p.iter_friend_ids(user_id=1, max_count=3))
+    assert pages == [[1, 2], [3]]
+    assert api.cursors == [-1, 1]
+
+
+@patch('time.sleep')
+def test_parallel_client_timeline_time_window(mock_sleep):
+    day = 24 * 60 * 60
+    now = 1600000000
+    timeline = [time_to_snowflake(now - i * day) for i in range(10)]
+    api = MockTimelineApi({1: timeline}, page_size=3)
+    p = ParallelTwitterClient(apis=[api])
+    posts = p.get_user_timeline(user_id=1,
+                                min_count=100,
+                                since_time=now - 4.5 * day,
+                                until_time=now - 0.5 * day)
+    assert [post.id for post in posts] == timeline[1:5]
+    # Paging starts at the newest post in the window and stops at the first
+    # page with an older post
+    assert len(api.timeline_calls) == 2
+    assert snowflake_to_time(timeline[3]) == now - 3 * day
+
+
+@patch('time.sleep')
+def test_parallel_client_timeline_skips_inactive_users(mock_sleep):
+    api = MockTimelineApi({1: [time_to_snowflake(1500000000)]})
+    p = ParallelTwitterClient(apis=[api])
+    assert p.get_user_timeline(user_id=1, since_time=1600000000) == []
+    assert len(api.timeline_calls) == 1
+
+
+class MockBusyLookupApi(MockLookupApi):
+    """ Holds each request open long enough for other threads to queue up
+    behind the key """
+    def UsersLookup(self, user_id, **params):
+        threading.Event().wait(0.05)
+        return super().UsersLookup(user_id, **params)
+
+
+@patch('time.sleep')
+def test_parallel_client_shares_key_between_threads(mock_sleep):
+    p = ParallelTwitterClient(apis=[MockBusyLookupApi()])
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(lambda i: p.users_lookup([i]), range(3)))
+    assert [[u.id for u in r] for r in results] == [[0], [1], [2]]
+
+
+@patch('time.time')
+@patch('time.sleep')
+def test_parallel_client_key_removed_during_rate_limit_wait(mock_sleep,
+                                                            mock_time):
+    mock_time.return_value = 1000
+    p = ParallelTwitterClient(apis=[MockSingleBlockedApi(1001, ['kanyewest'])])
+    key_id = p.key_state.key_ids[0]
+    # Remove the key while the request waits for its rate limit window
+    mock_sleep.side_effect = lambda seconds: p.remove_api(key_id)
+    assert p.get_friend_ids(screen_name='jack') == {'kanyewest'}
+    assert len(p.key_state) == 0
@@ -0,0 +1,52 @@
+""" Tests for the hydration pipeline. """
+
+from unittest.mock import patch
+
+import pytest
+
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.pipeline import HydrationPipeline
+
+GRAPH = {1: [10, 11, 12, 13, 14], 2: [13, 14, 15]}
+
+
+@patch('time.sleep')
+def test_pipeline_hydrates_deduplicated_followers(mock_sleep):
+    api = MockGraphApi(GRAPH)
+    p = ParallelTwitterClient(apis=[api])
+    users = []
+    stats = HydrationPipeline(p, fetch_workers=2).run([1, 2], users.append)
+    assert sorted(u.id for u in users) == [10, 11, 12, 13, 14, 15]
+    assert stats['fetch'].items == 8
+    assert stats['dedupe'].items == 6
+    assert stats['hydrate'].requests == 1
+    assert stats['sink'].items == 6
+
+
+@patch('time.sleep')
+def test_pipeline_runs_more_workers_than_keys(mock_sleep):
+    graph = {1: list(range(100, 350)), 2: list(range(300, 500)), 3: [1, 2]}
+    p = ParallelTwitterClient(apis=[MockGraphApi(graph, page_size=50,
+                                                 delay=0.01)])
+    users = []
+    stats = HydrationPipeline(p, fetch_workers=3, hydrate_workers=4).run(
+        [1, 2, 3], users.append)
+    assert sorted(u.id for u in users) == [1, 2] + list(range(100, 500))
+    assert stats['hydrate'].requests >= 4
+
+
+@patch('time.sleep')
+def test_pipeline_propagates_sink_errors(mock_sleep):
+    p = ParallelTwitterClient(apis=[MockGraphApi(GRAPH)])
+
+    def sink(user):
+        raise ValueError('sink failed')
+
+    with pytest.raises(ValueError):
+        HydrationPipeline(p).run([1, 2], sink)
+
+
+def test_pipeline_rejects_unknown_relation():
+    with pytest.raises(ValueError):
+        HydrationPipeline(None, relation='likes')
@@ -0,0 +1,72 @@
+""" Tests for the profiling hooks. """
+
+import time
+from unittest.mock import patch
+
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.profiling import PROFILER, Profiler, profile
+
+
+class FakeTransportApi:
+    def _RequestUrl(self, url):
+        time.sleep(0.01)
+        return url
+
+    def _ParseAndCheckTwitter(self, data):
+        return data
+
+    def GetData(self):
+        return self._ParseAndCheckTwitter(self._RequestUrl('data'))
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.timer('phase'):
+        pass
+    profiler.count('objects')
+    assert profiler.summary() == {}
+    assert profiler.counters() == {}
+
+
+def test_nested_phases_record_exclusive_time():
+    profiler = Profiler()
+    api = FakeTransportApi()
+    profiler.instrument(api)
+    with profile(profiler):
+        with profiler.timer('request'):
+            api.GetData()
+    summary = profiler.summary()
+    calls, total, exclusive = summary['request']
+    assert calls == 1
+    assert summary['transport'][1] >= 0.01
+    assert exclusive < total - 0.009
+    assert 'json_decode' in profiler.report()
+    assert not profiler.enabled
+
+
+@patch('time.sleep')
+def test_client_phases(mock_sleep):
+    p = ParallelTwitterClient(apis=[MockGraphApi({1: [2, 3]})])
+    with profile() as profiler:
+        p.get_followers(user_id=1, min_count=2, streaming_fn=lambda u: u.id)
+    summary = profiler.summary()
+    assert summary['client.get_followers'][0] == 1
+    assert summary['request.GetFollowerIDs'][0] == 1
+    assert summary['request.UsersLookup'][0] == 1
+    assert summary['callback'][0] == 1
+    assert not PROFILER.enabled
+
+
+@patch('time.sleep')
+def test_client_counts_pages_and_objects(mock_sleep):
+    p = ParallelTwitterClient(apis=[MockGraphApi({1: [2, 3, 4]})])
+    with profile() as profiler:
+        for page in p.iter_follower_ids(user_id=1):
+            p.users_lookup(page)
+    assert profiler.counters() == {
+        'pages.GetFollowerIDs': 2,
+        'objects.GetFollowerIDs': 3,
+        'pages.UsersLookup': 2,
+        'objects.UsersLookup': 3
+    }
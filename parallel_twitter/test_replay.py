@@ -0,0 +1,99 @@
+""" Tests for recording and replaying API traffic. """
+
+from unittest.mock import Mock, patch
+
+import pytest
+import twitter
+from twitter.ratelimit import EndpointRateLimit
+
+from parallel_twitter.error import ReplayError
+from parallel_twitter.mock_api import (
+    MockGraphApi,
+    MockRevokedApi,
+    MockSingleBlockedApi
+)
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.replay import Recorder, Replay
+
+GRAPH = {1: [10, 11, 12], 2: [12, 13]}
+
+
+@patch('time.sleep')
+def test_record_and_replay(mock_sleep, tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    with Recorder(path) as recorder:
+        apis = [recorder.wrap(MockGraphApi(GRAPH)) for _ in range(2)]
+        p = ParallelTwitterClient(apis=apis)
+        followers = p.get_followers(user_id=1, min_count=10)
+        users = p.users_lookup(followers)
+
+    replay = Replay(path)
+    assert replay.n_keys == 2
+    p = ParallelTwitterClient(apis=replay.apis())
+    assert p.get_followers(user_id=1, min_count=10) == followers
+    replayed = p.users_lookup(followers)
+    assert all(isinstance(u, twitter.User) for u in replayed)
+    assert replayed == users
+    with pytest.raises(ReplayError):
+        p.users_lookup([99])
+
+
+def test_replay_recorded_errors(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    with Recorder(path) as recorder:
+        api = recorder.wrap(MockRevokedApi())
+        with pytest.raises(twitter.TwitterError):
+            api.GetFriendIDsPaged(user_id=1)
+    api = Replay(path).apis()[0]
+    with pytest.raises(twitter.TwitterError) as ex:
+        api.GetFriendIDsPaged(user_id=1)
+    assert ex.value.message[0]['code'] == 89
+
+
+def test_replay_compresses_rate_limit_windows(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+
+    class Limited:
+        def CheckRateLimit(self, url):
+            return EndpointRateLimit(15, 0, recorded_at + 900)
+
+    with patch('time.time', return_value=1000.0):
+        recorded_at = 1000.0
+        with Recorder(path) as recorder:
+            recorder.wrap(Limited()).CheckRateLimit('/friends/ids.json')
+    with patch('time.time', return_value=5000.0):
+        replay = Replay(path, speed=100)
+    limit = replay.apis()[0].CheckRateLimit('/friends/ids.json')
+    assert limit.reset == pytest.approx(5009.0)
+
+
+def test_replay_compresses_request_spacing(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    with patch('time.sleep'):
+        with Recorder(path) as recorder:
+            api = recorder.wrap(MockGraphApi(GRAPH))
+            p = ParallelTwitterClient(apis=[api])
+            recorded = [p.get_friend_ids(user_id=u) for u in GRAPH]
+
+    replay = Replay(path, speed=1000)
+    p = ParallelTwitterClient(apis=replay.apis(),
+                              clock=replay.clock,
+                              sleep=replay.sleep)
+    with patch('time.sleep') as mock_sleep:
+        assert [p.get_friend_ids(user_id=u) for u in GRAPH] == recorded
+    # The last of three requests waits two minutes on the replay clock
+    assert max(c[0][0] for c in mock_sleep.call_args_list) == \
+        pytest.approx(0.12, abs=0.01)
+
+
+@patch('time.time')
+@patch('time.sleep')
+def test_rate_limit_margin_uses_injected_sleep(mock_sleep, mock_time):
+    mock_time.return_value = 1000
+    replay_sleep = Mock()
+    p = ParallelTwitterClient(apis=[MockSingleBlockedApi(1001, ['jack'])],
+                              sleep=replay_sleep)
+    assert p.get_friend_ids(screen_name='jack') == {'jack'}
+    # Only the wait until the reset is on the wall clock
+    mock_sleep.assert_called_once_with(1)
+    replay_sleep.assert_called_once_with(1)
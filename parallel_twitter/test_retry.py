@@ -0,0 +1,121 @@
+""" Tests for retrying transient failures. """
+
+import pytest
+import requests
+import twitter
+from unittest.mock import patch
+
+from parallel_twitter.error import OutOfKeysError, transient_error
+from parallel_twitter.mock_api import (
+    MockFlakyApi,
+    MockMissingUserApi,
+    MockSlowApi,
+    MockSlowFlakyApi,
+    MockValidApi
+)
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.retry import CircuitBreaker, RetryPolicy
+from parallel_twitter.twitter_operator import GetFriendIDs
+
+
+def test_transient_error_classification():
+    assert transient_error(requests.Timeout())
+    assert transient_error(twitter.TwitterError({'message': 'Capacity Error'}))
+    assert transient_error(twitter.TwitterError([{'code': 131}]))
+    assert not transient_error(twitter.TwitterError([{'code': 88}]))
+    assert not transient_error(twitter.TwitterError('Not authorized.'))
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(5, 2 ** (attempt - 1))
+
+
+def test_circuit_breaker_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=1000)
+    breaker.record_failure()
+    assert breaker.allows()
+    breaker.record_failure()
+    assert not breaker.allows()
+    breaker.record_success()
+    assert breaker.allows()
+
+
+@patch('time.time')
+def test_half_open_breaker_allows_one_trial(mock_time):
+    mock_time.return_value = 0
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record_failure()
+    assert not breaker.acquire()
+    mock_time.return_value = 10
+    assert breaker.allows()
+    assert breaker.acquire()
+    # Other callers wait for the trial request
+    assert not breaker.allows()
+    assert not breaker.acquire()
+    breaker.record_failure()
+    mock_time.return_value = 15
+    assert not breaker.acquire()
+    mock_time.return_value = 20
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.acquire() and breaker.acquire()
+
+
+def test_parallel_client_retries_transient_errors():
+    api = MockFlakyApi(n_failures=2, response=['kanyewest'])
+    p = ParallelTwitterClient(
+        apis=[api],
+        retry_policy=RetryPolicy(base_delay=0, failure_threshold=10)
+    )
+    assert p.get_friend_ids(screen_name='jack') == {'kanyewest'}
+    assert api.n_calls == 3
+
+
+def test_parallel_client_gives_up_after_max_retries():
+    api = MockFlakyApi(n_failures=10, response=['kanyewest'])
+    p = ParallelTwitterClient(
+        apis=[api],
+        retry_policy=RetryPolicy(max_retries=2, base_delay=0,
+                                 failure_threshold=10)
+    )
+    with pytest.raises(OutOfKeysError):
+        p.get_friend_ids(screen_name='jack')
+    assert api.n_calls == 3
+
+
+def test_parallel_client_hedges_slow_requests():
+    policy = RetryPolicy(hedge_percentile=50, hedge_min_samples=1)
+    policy.record_latency(GetFriendIDs, 0.01)
+    p = ParallelTwitterClient(
+        apis=[MockSlowApi(1, ['slow']), MockValidApi(['fast'])],
+        retry_policy=policy
+    )
+    assert p.get_friend_ids(screen_name='jack') == {'fast'}
+
+
+def test_parallel_client_hedge_records_losing_failure():
+    policy = RetryPolicy(hedge_percentile=50, hedge_min_samples=1)
+    policy.record_latency(GetFriendIDs, 0.01)
+    p = ParallelTwitterClient(
+        apis=[MockSlowFlakyApi(0.2), MockValidApi(['fast'])],
+        retry_policy=policy
+    )
+    slow_key = p.key_state.key_ids[0]
+    assert p.get_friend_ids(screen_name='jack') == {'fast'}
+    p._hedge_executor.shutdown(wait=True)
+    assert policy.breaker(slow_key).failures == 1
+
+
+@patch('time.sleep')
+def test_parallel_client_does_not_penalize_keys_for_bad_requests(mock_sleep):
+    apis = [MockMissingUserApi([0], ['kanyewest']) for _ in range(2)]
+    p = ParallelTwitterClient(apis=apis,
+                              retry_policy=RetryPolicy(base_delay=0))
+    for _ in range(3):
+        with pytest.raises(twitter.TwitterError):
+            p.get_friend_ids(user_id=0)
+    # Each bad request fails once instead of being retried on every key
+    assert sum(api.n_calls for api in apis) == 3
+    assert p.get_friend_ids(user_id=5) == {'kanyewest'}
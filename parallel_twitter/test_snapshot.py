@@ -0,0 +1,74 @@
+""" Tests for follower graph snapshots. """
+
+from unittest.mock import patch
+
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.snapshot import SnapshotStore
+
+
+def test_snapshot_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    assert store.load(1, 'followers') is None
+    store.save(1, 'followers', [2 ** 40, 3, 7], taken_at=100)
+    taken_at, ids = store.load(1, 'followers')
+    assert taken_at == 100
+    assert list(ids) == [3, 7, 2 ** 40]
+
+
+def test_snapshot_diff(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.save(1, 'friends', [1, 2, 3])
+    diff = store.diff(1, 'friends', [2, 3, 4])
+    assert list(diff.added) == [4]
+    assert list(diff.removed) == [1]
+
+
+@patch('time.sleep')
+def test_snapshot_update_stops_paging_early(mock_sleep, tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    api = MockGraphApi({1: [5, 4, 3, 2, 1]})
+    p = ParallelTwitterClient(apis=[api])
+    first = store.update(p, 1)
+    assert list(first.added) == [1, 2, 3, 4, 5]
+    assert first.n_requests == 3
+
+    api.graph[1] = [7, 6, 5, 4, 3, 2, 1]
+    second = store.update(p, 1)
+    assert list(second.added) == [6, 7]
+    assert not second.complete
+    assert second.n_requests == 2
+    assert list(store.load(1, 'followers')[1]) == [1, 2, 3, 4, 5, 6, 7]
+
+    api.graph[1] = [7, 6, 5, 4, 3, 2]
+    third = store.update(p, 1, early_stop=False)
+    assert third.complete
+    assert list(third.removed) == [1]
+
+
+@patch('time.sleep')
+def test_snapshot_update_keeps_private_account(mock_sleep, tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    api = MockGraphApi({1: [3, 2, 1]})
+    p = ParallelTwitterClient(apis=[api])
+    store.update(p, 1)
+
+    api.private.add(1)
+    diff = store.update(p, 1)
+    assert len(diff.removed) == 0
+    assert not diff.complete
+    assert list(store.load(1, 'followers')[1]) == [1, 2, 3]
+
+
+@patch('time.sleep')
+def test_snapshot_update_ignores_empty_pages(mock_sleep, tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    api = MockGraphApi({1: [2, 1]})
+    p = ParallelTwitterClient(apis=[api])
+    store.update(p, 1)
+
+    api.graph[1] = []
+    diff = store.update(p, 1)
+    assert diff.complete
+    assert list(diff.removed) == [1, 2]
+    assert list(store.load(1, 'followers')[1]) == []
@@ -0,0 +1,105 @@
+""" Tests for the worker pool that runs callbacks off the request path. """
+
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from parallel_twitter.mock_api import MockGraphApi
+from parallel_twitter.parallel_client import ParallelTwitterClient
+from parallel_twitter.profiling import profile
+from parallel_twitter.workers import WorkerPool
+
+
+def square(x: int, offset: int = 0) -> int:
+    return x * x + offset
+
+
+def test_inline_pool():
+    pool = WorkerPool(square, workers=0)
+    pool.submit([1, 2])
+    pool.submit([3], 1)
+    assert pool.drain() == [1, 4, 10]
+    assert pool.close() == []
+
+
+def test_ordered_pool_keeps_submission_order():
+    def slow_first(x: int) -> int:
+        if x == 0:
+            time.sleep(0.05)
+        return x
+
+    pool = WorkerPool(slow_first, workers=2)
+    pool.submit([0])
+    pool.submit([1])
+    time.sleep(0.02)
+    assert pool.drain() == []
+    assert pool.close() == [0, 1]
+
+
+def test_unordered_pool_returns_completed_batches():
+    release = threading.Event()
+
+    def blocked_first(x: int) -> int:
+        if x == 0:
+            release.wait(1)
+        return x
+
+    pool = WorkerPool(blocked_first, workers=2, ordered=False)
+    pool.submit([0])
+    pool.submit([1])
+    time.sleep(0.05)
+    assert pool.drain() == [1]
+    release.set()
+    assert pool.close() == [0]
+
+
+def test_pool_bounds_pending_batches():
+    release = threading.Event()
+    pool = WorkerPool(lambda x: release.wait(1), workers=1, max_pending=1)
+    pool.submit([0])
+    submitted = threading.Event()
+
+    def submit() -> None:
+        pool.submit([1])
+        submitted.set()
+
+    threading.Thread(target=submit).start()
+    assert not submitted.wait(0.05)
+    release.set()
+    assert submitted.wait(1)
+    assert pool.close() == [True, True]
+
+
+def test_pool_raises_errors():
+    pool = WorkerPool(lambda x: 1 // x, workers=2)
+    pool.submit([0])
+    with pytest.raises(ZeroDivisionError):
+        pool.close()
+
+
+def test_process_pool():
+    pool = WorkerPool(square, workers=2, kind='process')
+    pool.submit(range(3), 1)
+    assert pool.close() == [1, 2, 5]
+
+
+def test_process_pool_records_phase():
+    with profile() as profiler:
+        pool = WorkerPool(square, workers=2, kind='process', phase='rows')
+        pool.submit(range(3))
+        pool.submit(range(3, 5))
+        assert pool.close() == [0, 1, 4, 9, 16]
+    assert profiler.summary()['rows'][0] == 2
+
+
+@patch('time.sleep')
+def test_get_followers_streams_to_workers(mock_sleep):
+    p = ParallelTwitterClient(apis=[MockGraphApi({1: [2, 3, 4, 5]})])
+    result = p.get_followers(user_id=1,
+                             min_count=4,
+                             batch_size=2,
+                             streaming_fn=lambda u: u.id if u.id != 3 else None,
+                             workers=2)
+    assert result == [2, 4, 5]
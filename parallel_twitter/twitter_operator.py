@@ -1,52 +1,55 @@
 """ Twitter operations that can be parallelized. """
 
 from abc import ABC
-from functools import total_ordering
 import logging
-from typing import Any, List, Optional, Set, Tuple
+from typing import Any, List, Optional, Tuple
 
 import twitter
+from twitter.ratelimit import EndpointRateLimit
 
 LOGGER = logging.getLogger(__name__)
 
 
-@total_ordering
 class TwitterOp(ABC):
     """
-    A Twitter API operator paired with an API key.
+    A Twitter API operator. Operators hold no per-key state, so a single
+    instance serves every API key; rate limit state lives in
+    `key_state.KeyStateTable`.
     """
 
     reqs_per_minute = 1
+    # Whether the posts returned have every field that `StatusesLookup`
+    # requests, so that they can be served in its place
+    full_statuses = True
 
-    def __init__(self, api: twitter.Api, unique_id: Optional[int] = None):
-        """
-        Raise a `TwitterError` if the API key is invalid. The caller is
-        responsible for handling the error appropriately.
+    def invoke(self, api: twitter.Api, *args: Any) -> Any:
+        """ Execute the Twitter API call with the specified key. Raise a
+        `TwitterError` if the API call is unsuccessful.
 
         Parameters
         ----------
         api : twitter.Api
-            A Twitter API object to make requests through
-        unique_id : Optional[int]
-            An ID to identify this operator instance
+            A Twitter API object to make the request through
+        args : Any
+            Parameters for the operator
         """
-        self.api = api
-        self.unique_id = unique_id
-        self.renewal_time = 0
-        self._reset_renewal_time()
-
-    def invoke(self, *args: Any) -> Any:
-        """ Execute the Twitter API call. Raise a `TwitterError` if the API
-        call is unsuccessful."""
-        try:
-            return self._invoke(*args)
-        except twitter.TwitterError as ex:
-            self._reset_renewal_time()
-            raise ex
-
-    def _invoke(self, *args: Any) -> Any:
+        return self._invoke(api, *args)
+
+    def _invoke(self, api: twitter.Api, *args: Any) -> Any:
         raise NotImplementedError
 
+    def check_rate_limit(self, api: twitter.Api) -> EndpointRateLimit:
+        """
+        Return the current rate limit of this operator's endpoint for the
+        specified key. Raise a `TwitterError` if the API key is invalid.
+
+        Parameters
+        ----------
+        api : twitter.Api
+            A Twitter API object
+        """
+        return api.CheckRateLimit(self.rate_limit_endpoint)
+
     @property
     def rate_limit_endpoint(self) -> str:
         """
@@ -55,24 +58,8 @@ class TwitterOp(ABC):
         """
         raise NotImplementedError
 
-    def _reset_renewal_time(self) -> None:
-        """
-        Reset the renewal time for this API key if necessary.
-        """
-        rate_limit = self.api.CheckRateLimit(self.rate_limit_endpoint)
-        if rate_limit.remaining == 0:
-            LOGGER.info('Setting the renewal time for {0} to {1}'.format(
-                self, rate_limit.reset))
-            self.renewal_time = rate_limit.reset
-
-    def __eq__(self, other):
-        return self.renewal_time == other.renewal_time
-
-    def __lt__(self, other):
-        return self.renewal_time < other.renewal_time
-
     def __repr__(self):
-        return 'TwitterOp[ID={}]'.format(self.unique_id)
+        return type(self).__name__
 
 
 class GetFriendIDs(TwitterOp):
@@ -81,11 +68,13 @@ class GetFriendIDs(TwitterOp):
     following.
     """
     def _invoke(self,
+                api: twitter.Api,
                 user_id: Optional[int] = None,
                 screen_name: Optional[str] = None,
-                max_count: Optional[int] = None) -> Set[int]:
+                cursor: int = -1,
+                max_count: Optional[int] = None) -> Tuple[int, int, List[int]]:
         """
-        Return the users that the specified user is following.
+        Return one page of the users that the specified user is following.
 
         Parameters
         ----------
@@ -93,12 +82,17 @@ class GetFriendIDs(TwitterOp):
             The Twitter ID of the specified user
         screen_name : Optional[str]
             The Twitter handle of the specified user
+        cursor : int
+            Cursor to identify the page to pull, starting at -1
         max_count : Optional[int]
             The maximum number of friends to return. Defaults to 5000.
         """
-        return set(self.api.GetFriendIDs(user_id=user_id,
-                                         screen_name=screen_name,
-                                         total_count=max_count))
+        return api.GetFriendIDsPaged(
+            user_id=user_id,
+            screen_name=screen_name,
+            cursor=cursor,
+            count=max_count
+        )
 
     @property
     def rate_limit_endpoint(self) -> str:
@@ -111,6 +105,7 @@ class GetFollowerIDs(TwitterOp):
     user.
     """
     def _invoke(self,
+                api: twitter.Api,
                 user_id: Optional[int] = None,
                 screen_name: Optional[str] = None,
                 cursor: int = -1,
@@ -129,7 +124,7 @@ class GetFollowerIDs(TwitterOp):
         max_count : Optional[int]
             The maximum number of friends to return. Defaults to 5000.
         """
-        return self.api.GetFollowerIDsPaged(
+        return api.GetFollowerIDsPaged(
             user_id=user_id,
             screen_name=screen_name,
             cursor=cursor,
@@ -150,12 +145,14 @@ class GetUserTimeline(TwitterOp):
 
     def _invoke(
             self,
+            api: twitter.Api,
             user_id: Optional[int] = None,
             screen_name: Optional[str] = None,
             trim_user: Optional[bool] = False,
             include_rts: Optional[bool] = True,
             exclude_replies: Optional[bool] = False,
-            max_id: Optional[int] = None
+            max_id: Optional[int] = None,
+            since_id: Optional[int] = None
     ) -> List[twitter.Status]:
         """
         Return the posts on the specified user's timeline.
@@ -177,14 +174,17 @@ class GetUserTimeline(TwitterOp):
         max_id : Optional[int]
             Only return posts older than or equal to the specified ID. Defaults
             to None.
+        since_id : Optional[int]
+            Only return posts newer than the specified ID. Defaults to None.
         """
-        return self.api.GetUserTimeline(user_id=user_id,
-                                        screen_name=screen_name,
-                                        trim_user=trim_user,
-                                        include_rts=include_rts,
-                                        exclude_replies=exclude_replies,
-                                        count=200,
-                                        max_id=max_id)
+        return api.GetUserTimeline(user_id=user_id,
+                                   screen_name=screen_name,
+                                   trim_user=trim_user,
+                                   include_rts=include_rts,
+                                   exclude_replies=exclude_replies,
+                                   count=200,
+                                   max_id=max_id,
+                                   since_id=since_id)
 
     @property
     def rate_limit_endpoint(self) -> str:
@@ -198,7 +198,9 @@ class UsersLookup(TwitterOp):
 
     reqs_per_minute = 60
 
-    def _invoke(self, user_ids: List[int]) -> List[twitter.User]:
+    def _invoke(self,
+                api: twitter.Api,
+                user_ids: List[int]) -> List[twitter.User]:
         """
         Return a list of hydrated `User` objects.
 
@@ -207,7 +209,7 @@ class UsersLookup(TwitterOp):
         user_ids : List[int]
             List of Twitter IDs to hydrate
         """
-        return self.api.UsersLookup(user_id=user_ids)
+        return api.UsersLookup(user_id=user_ids)
 
     @property
     def rate_limit_endpoint(self) -> str:
@@ -221,7 +223,9 @@ class StatusesLookup(TwitterOp):
 
     reqs_per_minute = 60
 
-    def _invoke(self, post_ids: List[int]) -> List[twitter.Status]:
+    def _invoke(self,
+                api: twitter.Api,
+                post_ids: List[int]) -> List[twitter.Status]:
         """
         Return a list of hydrated `Status` objects.
 
@@ -230,8 +234,8 @@ class StatusesLookup(TwitterOp):
         post_ids : List[int]
             List of Twitter post IDs to hydrate
         """
-        return self.api.GetStatuses(status_ids=post_ids,
-                                    include_entities=True)
+        return api.GetStatuses(status_ids=post_ids,
+                               include_entities=True)
 
     @property
     def rate_limit_endpoint(self) -> str:
@@ -244,8 +248,11 @@ class GetFavorites(TwitterOp):
     """
 
     reqs_per_minute = 5
+    # Requested without entities
+    full_statuses = False
 
     def _invoke(self,
+                api: twitter.Api,
                 user_id: Optional[int] = None,
                 screen_name: Optional[str] = None,
                 max_count: Optional[int] = 200) -> List[twitter.Status]:
@@ -262,10 +269,10 @@ class GetFavorites(TwitterOp):
             The maximum number of posts to return with a maximum of 200.
             Defaults to 200.
         """
-        return self.api.GetFavorites(user_id=user_id,
-                                     screen_name=screen_name,
-                                     count=max_count,
-                                     include_entities=False)
+        return api.GetFavorites(user_id=user_id,
+                                screen_name=screen_name,
+                                count=max_count,
+                                include_entities=False)
 
     @property
     def rate_limit_endpoint(self) -> str:
@@ -0,0 +1,194 @@
+""" Run user callbacks and row transforms off the request path. """
+
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Iterable, List, Optional, Tuple
+
+from parallel_twitter.profiling import PROFILER
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _apply(fn: Callable[..., Any],
+           items: List[Any],
+           args: Tuple[Any, ...],
+           phase: str) -> List[Any]:
+    """ Apply a function to a batch of items. Defined at module level so
+    that batches can be sent to a process pool. """
+    with PROFILER.timer(phase):
+        return [fn(item, *args) for item in items]
+
+
+def _apply_timed(fn: Callable[..., Any],
+                 items: List[Any],
+                 args: Tuple[Any, ...]) -> Tuple[List[Any], float]:
+    """ Apply a function to a batch of items in a worker process and return
+    the results with the seconds taken, since the profiler of the worker
+    process is not collected. """
+    start = time.perf_counter()
+    results = [fn(item, *args) for item in items]
+    return results, time.perf_counter() - start
+
+
+class WorkerPool:
+    """
+    Apply a function to batches of items on a thread or process pool, so
+    that pulling the next page of results continues while earlier pages are
+    processed.
+
+    At most `max_pending` batches are queued or running at once; `submit`
+    blocks once the pool is that far behind, so a slow function cannot
+    buffer an unbounded number of API results. With `workers=0`, batches
+    are processed inline when they are submitted.
+
+    The time spent in the function is recorded as the `phase` of the global
+    `PROFILER`. With `kind='process'`, each batch is timed in its worker
+    process and recorded in this process once it completes.
+    """
+
+    KINDS = ('thread', 'process')
+
+    def __init__(self,
+                 fn: Callable[..., Any],
+                 workers: int = 4,
+                 kind: str = 'thread',
+                 ordered: bool = True,
+                 max_pending: Optional[int] = None,
+                 phase: str = 'callback'):
+        """
+        Parameters
+        ----------
+        fn : Callable[..., Any]
+            The function to apply to each item. With `kind='process'`, it
+            must be picklable, e.g. a module-level function.
+        workers : int
+            The number of threads or processes. Defaults to 4.
+        kind : str
+            Either 'thread' or 'process'. Processes avoid the GIL for
+            CPU-heavy functions but pickle every item. Defaults to 'thread'.
+        ordered : bool
+            Whether to return results in the order the batches were
+            submitted, rather than as they complete. Defaults to True.
+        max_pending : Optional[int]
+            The maximum number of batches queued or running. Defaults to
+            twice the number of workers.
+        phase : str
+            The profiling phase to time the function as. Defaults to
+            'callback'.
+        """
+        if kind not in WorkerPool.KINDS:
+            raise ValueError('kind must be one of {}'.format(WorkerPool.KINDS))
+        self.fn = fn
+        self.workers = workers
+        self.kind = kind
+        self.ordered = ordered
+        self.phase = phase
+        self._executor: Optional[Executor] = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(workers) if kind == 'thread' \
+                else ProcessPoolExecutor(workers)
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * workers
+                                                 or 1)
+        self._pending: Deque[Future] = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, items: Iterable[Any], *args: Any) -> None:
+        """
+        Queue a batch of items, blocking while `max_pending` batches are
+        already queued or running.
+
+        Parameters
+        ----------
+        items : Iterable[Any]
+            The items to apply the function to
+        args : Any
+            Extra arguments passed to the function after each item
+        """
+        items = list(items)
+        if len(items) == 0:
+            return
+        future: Future
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(_apply(self.fn, items, args, self.phase))
+            except Exception as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+            with self._lock:
+                self._pending.append(future)
+            return
+        with PROFILER.timer('wait.workers'):
+            self._slots.acquire()
+        try:
+            if self.kind == 'process':
+                future = self._executor.submit(_apply_timed, self.fn, items,
+                                               args)
+                future.add_done_callback(self._record_time)
+            else:
+                future = self._executor.submit(_apply, self.fn, items, args,
+                                               self.phase)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.append(future)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def drain(self) -> List[Any]:
+        """ Return the results that are ready, without blocking. Raise the
+        error of a failed batch. """
+        results: List[Any] = []
+        with self._lock:
+            if self.ordered:
+                while len(self._pending) > 0 and self._pending[0].done():
+                    results.extend(self._result(self._pending.popleft()))
+            else:
+                done = [f for f in self._pending if f.done()]
+                for future in done:
+                    self._pending.remove(future)
+                for future in done:
+                    results.extend(self._result(future))
+        return results
+
+    def close(self) -> List[Any]:
+        """ Wait for every batch, shut the pool down and return the results
+        that were not drained yet. """
+        try:
+            with self._lock:
+                pending = list(self._pending)
+            wait(pending)
+            return self.drain()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """ Stop the workers, cancelling batches that have not started. """
+        with self._lock:
+            for future in self._pending:
+                future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _result(self, future: Future) -> List[Any]:
+        """ Return the results of a completed batch. """
+        if self.kind == 'process' and self._executor is not None:
+            return future.result()[0]
+        return future.result()
+
+    def _record_time(self, future: Future) -> None:
+        """ Record the time a batch took in a worker process. """
+        if future.cancelled() or future.exception() is not None:
+            return
+        elapsed = future.result()[1]
+        if PROFILER.enabled:
+            PROFILER.record(self.phase, elapsed, elapsed)
+
+    def __enter__(self) -> 'WorkerPool':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
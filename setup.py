@@ -28,6 +28,9 @@ setup(
         'pytest==5.0.1',
         'python-twitter==3.5'
     ],
+    extras_require={
+        'fast': ['numpy']
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',